@@ -0,0 +1,109 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks and micro-benchmark for the per-hub action queue (action_queue.py).
+
+Runs request sequences against an ActionQueue whose first request blocks until the rest are submitted, and
+checks what actually runs, in order, then measures the cost of submit() with a full queue of distinct targets.
+
+    python benchmarks/bench_action_queue.py
+    python benchmarks/bench_action_queue.py --submits 200000
+
+Only action_queue.py and metrics.py are needed, no Indigo or hub connection.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "camect.indigoPlugin", "Contents", "Server Plugin"))
+
+from action_queue import ActionQueue    # noqa: E402
+
+MODE = ("mode",)
+ALERTS = ("alerts", ("c1",), "check")
+
+# (name, [(key, coalesce key)], keys expected to run).  The first request is running while the rest are submitted.
+SEQUENCES = [
+    ("mode HOME, AWAY, HOME", [(("mode", "HOME"), MODE), (("mode", "AWAY"), MODE), (("mode", "HOME"), MODE)],
+     [("mode", "HOME"), ("mode", "HOME")]),
+    ("mode HOME, HOME", [(("mode", "HOME"), MODE), (("mode", "HOME"), MODE)],
+     [("mode", "HOME")]),
+    ("mode HOME, AWAY, AWAY", [(("mode", "HOME"), MODE), (("mode", "AWAY"), MODE), (("mode", "AWAY"), MODE)],
+     [("mode", "HOME"), ("mode", "AWAY")]),
+    ("alerts disable, enable, disable",
+     [(("alerts", False, ("c1",), "check"), ALERTS), (("alerts", True, ("c1",), "check"), ALERTS),
+      (("alerts", False, ("c1",), "check"), ALERTS)],
+     [("alerts", False, ("c1",), "check"), ("alerts", False, ("c1",), "check")]),
+    ("alerts disable, enable",
+     [(("alerts", False, ("c1",), "check"), ALERTS), (("alerts", True, ("c1",), "check"), ALERTS)],
+     [("alerts", False, ("c1",), "check"), ("alerts", True, ("c1",), "check")]),
+    ("snapshot a, b, a", [(("snapshot", "c1", "a"), None), (("snapshot", "c1", "b"), None),
+                          (("snapshot", "c1", "a"), None)],
+     [("snapshot", "c1", "a"), ("snapshot", "c1", "b")]),
+]
+
+
+def run_sequence(requests):
+    ran = []
+    release = threading.Event()
+    finished = threading.Semaphore(0)
+
+    def action(key, first):
+        if first:
+            release.wait(5.0)
+        ran.append(key)
+        finished.release()
+
+    queue = ActionQueue("check")
+    accepted = 0
+    for index, (key, coalesce) in enumerate(requests):
+        accepted += queue.submit(key, action, key, index == 0, coalesce=coalesce)
+        if index == 0:
+            # let the worker pick up the first request, so the rest arrive while it runs
+            while queue.depth():
+                time.sleep(0.001)
+    release.set()
+    for _ in range(accepted - queue.stats()['coalesced']):
+        finished.acquire(timeout=5.0)
+    queue.stop(timeout=5.0)
+    return ran
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--submits", type=int, default=100000)
+    args = parser.parse_args()
+
+    failed = False
+    for name, requests, expected in SEQUENCES:
+        ran = run_sequence(requests)
+        ok = ran == expected
+        failed |= not ok
+        print(f"{name:34} {'ok' if ok else 'FAILED'}  ran {[key[1:] for key in ran]}")
+
+    # submit() cost with a full queue of distinct targets, every request coalescing into a queued one
+    release = threading.Event()
+    queue = ActionQueue("bench", max_size=64)
+    queue.submit(("block",), release.wait)
+    while queue.depth():
+        time.sleep(0.001)
+    for target in range(64):
+        queue.submit(("ptz", target, 0), lambda: None, coalesce=("ptz", target))
+    start = time.perf_counter()
+    for n in range(args.submits):
+        queue.submit(("ptz", n % 64, n), lambda: None, coalesce=("ptz", n % 64))
+    submit_us = (time.perf_counter() - start) / args.submits * 1e6
+    release.set()
+    queue.stop(timeout=5.0)
+    print(f"{'submit() with 64 queued':34} {submit_us:9.2f} us/request, {queue.stats()['coalesced']} coalesced")
+
+    if failed:
+        sys.exit("action queue ran the wrong requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark for snapshot derivatives (derivatives.py): thumbnail, dashboard and full size copies of camera
+snapshots, made in worker processes, in worker threads, or inline on the calling thread.
+
+For each mode it reports wall time for the batch, the time the calling thread was busy (the cost to the
+plugin's own threads), and the per-stage p50/p95 from SnapshotProcessor.
+
+    python benchmarks/bench_derivatives.py
+    python benchmarks/bench_derivatives.py --images 32 --width 3840 --height 2160 --workers 4
+
+Needs Pillow, no Indigo or hub connection.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "camect.indigoPlugin", "Contents", "Server Plugin"))
+
+from derivatives import SnapshotProcessor, render, parse_sizes, derivative_path, DEFAULT_SIZES, STAGES  # noqa: E402
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def make_images(folder, count, width, height):
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"snapshot-c{i}.jpg")
+        # a fractal rather than a flat color, so the JPEG has realistic entropy
+        image = Image.effect_mandelbrot((width, height), (-2.0 + i * 0.01, -1.2, 1.0, 1.2), 100).convert("RGB")
+        image.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def run_pool(paths, sizes, workers, threaded):
+    processor = SnapshotProcessor(sizes, workers)
+    processor._threaded = threaded
+    # start the workers before timing, as they are in a running plugin
+    processor._pool().submit(time.sleep, 0).result()
+
+    expected = processor.completed + processor.failed + len(paths)
+    start = time.perf_counter()
+    cpu = time.thread_time()
+    for path in paths:
+        processor.submit(path)
+    caller_ms = (time.thread_time() - cpu) * 1000.0
+    while processor.completed + processor.failed < expected:
+        time.sleep(0.005)
+    wall = time.perf_counter() - start
+    stats = processor.stats()
+    processor.stop()
+    return wall, caller_ms, stats
+
+
+def run_inline(paths, sizes):
+    start = time.perf_counter()
+    cpu = time.thread_time()
+    for path in paths:
+        render(path, [(derivative_path(path, label), width, quality) for label, width, quality in sizes])
+    return time.perf_counter() - start, (time.thread_time() - cpu) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--width", type=int, default=2688)
+    parser.add_argument("--height", type=int, default=1520)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES)
+    args = parser.parse_args()
+
+    if Image is None:
+        sys.exit("Pillow is not installed")
+
+    sizes = parse_sizes(args.sizes)
+    folder = tempfile.mkdtemp()
+    paths = make_images(folder, args.images, args.width, args.height)
+    print(f"{args.images} snapshots {args.width}x{args.height}, sizes {args.sizes}, {args.workers} workers")
+
+    wall, caller_ms = run_inline(paths, sizes)
+    print(f"    inline     {wall:6.2f} s, {len(paths) / wall:5.1f} images/sec, calling thread busy {caller_ms:8.1f} ms")
+
+    for name, threaded in (("processes", False), ("threads", True)):
+        wall, caller_ms, stats = run_pool(paths, sizes, args.workers, threaded)
+        stages = ", ".join(f"{stage} {stats[f'{stage}_p50_ms']:.0f}/{stats[f'{stage}_p95_ms']:.0f}" for stage in STAGES)
+        print(f"    {name:<10} {wall:6.2f} s, {len(paths) / wall:5.1f} images/sec, calling thread busy {caller_ms:8.1f} ms, "
+              f"{stats['failed']} failed ({stats['mode']})")
+        print(f"               p50/p95 ms: {stages}")
+
+
+if __name__ == "__main__":
+    main()
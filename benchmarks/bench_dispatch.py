@@ -0,0 +1,224 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark for Plugin.hub_message and trigger dispatch.
+
+Runs the real plugin.py against the stand-in indigo module in fake_indigo.py, with a replay client in
+place of the Camect connection, and feeds it synthetic or recorded event streams.
+
+    python benchmarks/bench_dispatch.py                          # all scenarios
+    python benchmarks/bench_dispatch.py --scenario alert-storm --events 50000
+    python benchmarks/bench_dispatch.py --replay events.jsonl --triggers 2000
+
+A replay file has one websocket message (the raw JSON event) per line; messages are spread across the
+configured hubs round robin.  The plugin's requirements (requests, websocket-client) must be installed.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "camect.indigoPlugin", "Contents", "Server Plugin"))
+
+import fake_indigo   # noqa: E402
+fake_indigo.install()
+
+import plugin         # noqa: E402
+from health import LinkHealth   # noqa: E402
+
+OBJECTS = ["person", "car", "truck", "dog", "cat", "bicycle", "motorcycle", "bird", "bear", "deer", "package"]
+
+SCENARIOS = {
+    # name: hubs, cameras per hub, triggers, events, duplicate fraction, event mix (alert, camera, mode)
+    "alert-storm": dict(hubs=1, cameras=8, triggers=200, events=20000, duplicates=0.3, mix=(1.0, 0.0, 0.0)),
+    "many-cameras": dict(hubs=4, cameras=64, triggers=500, events=20000, duplicates=0.1, mix=(0.9, 0.08, 0.02)),
+    "many-triggers": dict(hubs=2, cameras=16, triggers=5000, events=10000, duplicates=0.0, mix=(0.95, 0.04, 0.01)),
+}
+
+
+########################################
+class ReplayClient:
+    ########################################
+    """ Stands in for Camect: answers the startup calls and reports idle connection statistics.
+    """
+
+    class _Events:
+        _thread = None
+
+        @staticmethod
+        def stats():
+            return {'depth': 0, 'max_depth': 0, 'received': 0, 'dispatched': 0, 'dropped': 0, 'coalesced': 0,
+                    'lag_avg': 0.0, 'lag_max': 0.0}
+
+    def __init__(self, hub_id, cameras):
+        self.hub_id = hub_id
+        self.cameras = cameras
+        self.events = self._Events()
+        self.reconnects = 0
+        self.health = LinkHealth()
+        self.ping_interval = self.pong_timeout = 0      # no websocket, so no stale checks
+
+    def wait_ready(self, timeout=None):
+        return True
+
+    def get_info(self):
+        return {'name': f"Hub {self.hub_id}", 'cloud_url': "", 'local_https_url': "", 'mode': "DEFAULT",
+                'id': f"hub{self.hub_id}", 'object_name': OBJECTS}
+
+    def list_cameras(self):
+        return self.cameras
+
+    def connection_stats(self):
+        return {'connections': 0, 'requests': 0}
+
+    def live_threads(self):
+        return 0
+
+    def close(self, timeout=None):
+        pass
+
+
+def make_cameras(hub_index, count):
+    return [{'id': f"h{hub_index}c{i}", 'name': f"Camera {hub_index}-{i}", 'disabled': False,
+             'width': 1920, 'height': 1080} for i in range(count)]
+
+
+def setup(hubs, cameras_per_hub, trigger_count, rng):
+    fake_indigo.devices.clear()
+    logging.getLogger("Plugin").setLevel(logging.WARNING)
+    prefs = {'logLevel': logging.WARNING, 'discovery': False}      # no mDNS browsing while benchmarking
+    instance = plugin.Plugin("com.flyingdiver.indigoplugin.camect", "Camect", "bench", prefs)
+    instance.startup()
+
+    hub_cameras = {}
+    for h in range(hubs):
+        dev_id = 1000 + h
+        cameras = make_cameras(h, cameras_per_hub)
+        hub_cameras[dev_id] = cameras
+        fake_indigo.devices[dev_id] = fake_indigo.Device(dev_id, f"Hub {h}", {'address': "127.0.0.1"})
+
+    instance.create_client = lambda device: ReplayClient(device.id, hub_cameras[device.id])
+    for dev_id in hub_cameras:
+        instance.deviceStartComm(fake_indigo.devices[dev_id])
+    deadline = time.time() + 10.0
+    while len(instance.camect_cameras) < hubs and time.time() < deadline:
+        time.sleep(0.01)
+
+    hub_ids = list(hub_cameras)
+    for t in range(trigger_count):
+        kind = rng.random()
+        hub = rng.choice(["-1"] + [str(h) for h in hub_ids] * 3)
+        cam = "-1" if hub == "-1" or rng.random() < 0.2 else rng.choice(hub_cameras[int(hub)])['id']
+        if kind < 0.85:
+            objects = ["-1"] if rng.random() < 0.1 else rng.sample(OBJECTS, rng.randint(1, 3))
+            trigger = fake_indigo.Trigger(t, "alertEvent", {'camectID': hub, 'cameraID': cam, 'object': objects})
+        elif kind < 0.95:
+            trigger = fake_indigo.Trigger(t, "cameraEvent", {'camectID': hub, 'cameraID': cam,
+                                                             'type': rng.choice(["camera_offline", "camera_online"])})
+        else:
+            trigger = fake_indigo.Trigger(t, "modeEvent", {'camectID': hub})
+        instance.triggerStartProcessing(trigger)
+
+    return instance, hub_cameras
+
+
+def synthetic_events(hub_cameras, count, duplicates, mix, rng):
+    hub_ids = list(hub_cameras)
+    previous = None
+    for n in range(count):
+        if previous and rng.random() < duplicates:
+            yield previous
+            continue
+        dev_id = rng.choice(hub_ids)
+        camera = rng.choice(hub_cameras[dev_id])
+        kind = rng.random()
+        if kind < mix[0]:
+            objects = rng.sample(OBJECTS, rng.randint(1, 3))
+            event = {'type': "alert", 'cam_id': camera['id'], 'cam_name': camera['name'],
+                     'desc': f"{camera['name']} just saw {', '.join(objects)} ({n})",
+                     'url': f"https://local.camect.com/alert/{n}", 'detected_obj': objects}
+        elif kind < mix[0] + mix[1]:
+            event = {'type': rng.choice(["camera_offline", "camera_online"]), 'cam_id': camera['id'],
+                     'cam_name': camera['name']}
+        else:
+            event = {'type': "mode", 'desc': rng.choice(["DEFAULT", "HOME"])}
+        previous = (dev_id, json.dumps(event))
+        yield previous
+
+
+def replay_events(path, hub_cameras):
+    hub_ids = list(hub_cameras)
+    with open(path) as f:
+        for n, line in enumerate(line for line in f if line.strip()):
+            yield hub_ids[n % len(hub_ids)], line.strip()
+
+
+def run(name, instance, events):
+    fake_indigo.counters.reset()
+    latencies = []
+    start = time.perf_counter()
+    for dev_id, message in events:
+        t0 = time.perf_counter()
+        instance.hub_message(dev_id=dev_id, message=message)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    for writer in instance.state_writers.values():
+        writer.flush()
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))] * 1e6
+
+    counters = fake_indigo.counters
+    print(f"{name}: {len(latencies)} events in {elapsed:.3f} s, {len(latencies) / elapsed:,.0f} events/sec")
+    print(f"    latency us: p50 {pct(50):.1f}, p95 {pct(95):.1f}, p99 {pct(99):.1f}, max {latencies[-1] * 1e6:.1f}")
+    print(f"    trigger executions {counters.trigger_executions}, state writes {counters.state_writes} "
+          f"({counters.state_keys} keys)")
+
+    # processed events are recorded in each hub's history buffer, up to its size
+    history = sum(len(buffer) for buffer in instance.event_history.values())
+    assert history > 0, "no events recorded in the event history"
+    print(f"    event history {history} events")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), help="run one scenario (default all)")
+    parser.add_argument("--replay", help="replay recorded events from a file instead of synthetic ones")
+    parser.add_argument("--hubs", type=int)
+    parser.add_argument("--cameras", type=int, help="cameras per hub")
+    parser.add_argument("--triggers", type=int)
+    parser.add_argument("--events", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    names = [args.scenario] if args.scenario else sorted(SCENARIOS)
+    if args.replay:
+        names = names[:1] if args.scenario else ["alert-storm"]
+    for name in names:
+        config = dict(SCENARIOS[name])
+        for key in ("hubs", "cameras", "triggers", "events"):
+            if getattr(args, key) is not None:
+                config[key] = getattr(args, key)
+        rng = random.Random(args.seed)
+        instance, hub_cameras = setup(config['hubs'], config['cameras'], config['triggers'], rng)
+        if args.replay:
+            events = list(replay_events(args.replay, hub_cameras))
+            name = f"replay {os.path.basename(args.replay)}"
+        else:
+            events = list(synthetic_events(hub_cameras, config['events'], config['duplicates'], config['mix'], rng))
+        print(f"{name}: {config['hubs']} hubs x {config['cameras']} cameras, {config['triggers']} triggers")
+        run(name, instance, events)
+        for dev_id in hub_cameras:
+            instance.deviceStopComm(fake_indigo.devices[dev_id])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the on-disk event store (event_store.py).
+
+Measures the cost of EventStore.add() on the event path, writer throughput, and a daily per-camera report
+read from the rollup table against the same report computed from the raw events.
+
+    python benchmarks/bench_event_store.py
+    python benchmarks/bench_event_store.py --events 200000 --days 30
+
+Only the standard library and event_store.py are needed, no Indigo or hub connection.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "camect.indigoPlugin", "Contents", "Server Plugin"))
+
+from event_store import EventStore    # noqa: E402
+
+OBJECTS = ["person", "car", "truck", "dog", "cat", "bicycle", "package"]
+
+
+def raw_report(path, since):
+    # what a report costs without rollups: group the raw events by local day and camera
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT hub, date(time, 'unixepoch', 'localtime') AS day, cam_id, COUNT(*) FROM events "
+                          "WHERE time >= ? GROUP BY hub, day, cam_id", (since,)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=30, help="days the events are spread over")
+    parser.add_argument("--hubs", type=int, default=2)
+    parser.add_argument("--cameras", type=int, default=16, help="cameras per hub")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = time.time()
+    events = [(rng.randrange(args.hubs), now - rng.random() * args.days * 86400,
+               {'type': 'alert', 'cam_id': f"c{rng.randrange(args.cameras)}", 'cam_name': "Camera",
+                'detected_obj': rng.sample(OBJECTS, rng.randint(1, 2)), 'desc': "Alert"})
+              for _ in range(args.events)]
+    events.sort(key=lambda event: event[1])
+
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "events.sqlite")
+    store = EventStore(path, retention=args.days + 1, rollup_retention=args.days + 1, max_pending=args.events)
+
+    start = time.perf_counter()
+    for hub, when, event in events:
+        store.add(hub, event, when)
+    add_us = (time.perf_counter() - start) / len(events) * 1e6
+    store.close(timeout=None)
+    elapsed = time.perf_counter() - start
+    stats = store.stats()
+
+    print(f"{args.events} events over {args.days} days ({args.hubs} hubs x {args.cameras} cameras)")
+    print(f"    add()           {add_us:9.2f} us/event")
+    print(f"    written         {stats['written'] / elapsed:9.0f} events/sec, {stats['batches']} batches, "
+          f"{stats['dropped']} dropped, database {os.path.getsize(path) / 1048576:.1f} MB")
+
+    # start of the local day 7 days ago, where the rollup's daily buckets begin
+    since = datetime.fromtimestamp(now - 7 * 86400).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+    start = time.perf_counter()
+    rollup = store.counts(period="day", since=since, group_by=("cam_id",))
+    rollup_ms = (time.perf_counter() - start) * 1000.0
+    start = time.perf_counter()
+    raw = raw_report(path, since)
+    raw_ms = (time.perf_counter() - start) * 1000.0
+    rollup_total = sum(row['count'] for row in rollup)
+    raw_total = sum(row[3] for row in raw)
+    print(f"    7 day report    rollup {rollup_ms:7.2f} ms ({len(rollup)} rows, {rollup_total} events), "
+          f"raw scan {raw_ms:7.2f} ms ({len(raw)} rows, {raw_total} events)")
+    if (len(rollup), rollup_total) != (len(raw), raw_total):
+        sys.exit("rollup and raw counts differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark for alert trigger matching: per-event cost with thousands of alertEvent triggers.
+
+Compares three ways of finding the triggers for an alert:
+    scan-substring  - the original loop over every trigger, with `obj in ' '.join(detected_obj)`
+    scan-predicate  - a loop over every trigger, evaluating its compiled AlertPredicate
+    index-predicate - TriggerIndex lookup by hub, camera and object, then the candidates' predicates (plugin.py)
+
+    python benchmarks/bench_triggers.py
+    python benchmarks/bench_triggers.py --triggers 1000 5000 20000 --events 20000
+
+Only triggers.py is needed, no Indigo or hub connection.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "camect.indigoPlugin", "Contents", "Server Plugin"))
+
+from triggers import TriggerIndex, AlertPredicate, ANY    # noqa: E402
+
+# "cat"/"cattle" and "car"/"cart" overlap as substrings
+OBJECTS = ["person", "car", "cart", "truck", "dog", "cat", "cattle", "bicycle", "motorcycle", "bird", "bear",
+           "deer", "package"]
+
+
+def make_triggers(count, hubs, cameras, rng):
+    triggers = []
+    for trigger_id in range(count):
+        hub = ANY if rng.random() < 0.1 else str(rng.randrange(hubs))
+        camera = ANY if rng.random() < 0.2 else f"c{rng.randrange(cameras)}"
+        props = {'camectID': hub, 'cameraID': camera,
+                 'object': [ANY] if rng.random() < 0.1 else rng.sample(OBJECTS, rng.randint(1, 3))}
+        if rng.random() < 0.2:
+            props['matchAll'] = True
+        if rng.random() < 0.3:
+            props['excludeObject'] = rng.sample(OBJECTS, 1)
+        if rng.random() < 0.3:
+            props['startTime'], props['endTime'] = rng.choice([("22:00", "06:00"), ("08:00", "18:00")])
+        triggers.append((trigger_id, props, AlertPredicate.from_props(props)))
+    return triggers
+
+
+def make_events(count, hubs, cameras, rng):
+    return [(str(rng.randrange(hubs)), f"c{rng.randrange(cameras)}", rng.sample(OBJECTS, rng.randint(1, 3)),
+             rng.randrange(24 * 60)) for _ in range(count)]
+
+
+def scan_substring(triggers, hub, camera, detected, minute):
+    # the original plugin.py matching: hub and camera equality, then a substring test per object
+    found = []
+    joined = ' '.join(detected)
+    for trigger_id, props, _ in triggers:
+        if props['camectID'] != ANY and props['camectID'] != hub:
+            continue
+        if props['cameraID'] != ANY and props['cameraID'] != camera:
+            continue
+        for obj in props['object']:
+            if obj == ANY or obj in joined:
+                found.append(trigger_id)
+                break
+    return found
+
+
+def scan_predicate(triggers, hub, camera, detected, minute):
+    found = []
+    objects = frozenset(detected)
+    for trigger_id, props, predicate in triggers:
+        if props['camectID'] != ANY and props['camectID'] != hub:
+            continue
+        if props['cameraID'] != ANY and props['cameraID'] != camera:
+            continue
+        if predicate.matches(objects, minute):
+            found.append(trigger_id)
+    return found
+
+
+def index_predicate(index, predicates, hub, camera, detected, minute):
+    candidates = index.lookup(hub, camera, detected)
+    if not candidates:
+        return []
+    objects = frozenset(detected)
+    return [trigger_id for trigger_id in candidates if predicates[trigger_id].matches(objects, minute)]
+
+
+def timed(func, events):
+    results = []
+    start = time.perf_counter()
+    for event in events:
+        results.append(func(*event))
+    return (time.perf_counter() - start) / len(events) * 1e6, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--triggers", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--hubs", type=int, default=2)
+    parser.add_argument("--cameras", type=int, default=32, help="cameras per hub")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for count in args.triggers:
+        rng = random.Random(args.seed)
+        triggers = make_triggers(count, args.hubs, args.cameras, rng)
+        events = make_events(args.events, args.hubs, args.cameras, rng)
+
+        start = time.perf_counter()
+        index = TriggerIndex(3)
+        predicates = {}
+        for trigger_id, props, _ in triggers:
+            predicates[trigger_id] = AlertPredicate.from_props(props)
+            index.add(trigger_id, None, props['camectID'], props['cameraID'], props['object'])
+        build_ms = (time.perf_counter() - start) * 1000.0
+
+        substring_us, substring = timed(lambda *event: scan_substring(triggers, *event), events)
+        scan_us, scanned = timed(lambda *event: scan_predicate(triggers, *event), events)
+        index_us, indexed = timed(lambda *event: index_predicate(index, predicates, *event), events)
+
+        mismatches = sum(1 for a, b in zip(scanned, indexed) if sorted(a) != sorted(b))
+        matches = sum(len(found) for found in indexed)
+        # substring hits that set matching rejects, counting only triggers without extra conditions
+        plain = {trigger_id for trigger_id, props, predicate in triggers
+                 if not predicate.match_all and not predicate.excluded and not predicate.window}
+        false_hits = sum(len((set(a) - set(b)) & plain) for a, b in zip(substring, indexed))
+
+        print(f"{count} triggers, {len(events)} events ({args.hubs} hubs x {args.cameras} cameras), "
+              f"compiled and indexed in {build_ms:.1f} ms")
+        print(f"    scan-substring  {substring_us:9.1f} us/event")
+        print(f"    scan-predicate  {scan_us:9.1f} us/event")
+        print(f"    index-predicate {index_us:9.1f} us/event, {matches / len(events):.1f} matches/event, "
+              f"{mismatches} differences from scan-predicate")
+        print(f"    substring false matches: {false_hits} ({false_hits / len(events):.2f}/event)")
+
+
+if __name__ == "__main__":
+    main()
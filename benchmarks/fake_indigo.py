@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Stand-in for the parts of the Indigo `indigo` module used by plugin.py, so the plugin can be driven
+offline.  Install it with install() before importing plugin.  State writes and trigger executions are
+counted rather than sent anywhere.
+"""
+
+import logging
+import sys
+import tempfile
+import time
+
+THREADDEBUG = 5
+
+
+class _Counters:
+    def __init__(self):
+        self.state_writes = 0
+        self.state_keys = 0
+        self.trigger_executions = 0
+
+    def reset(self):
+        self.__init__()
+
+
+counters = _Counters()
+
+
+class Dict(dict):
+    pass
+
+
+class List(list):
+    pass
+
+
+class kStateImageSel:
+    SensorOff = "SensorOff"
+    SensorOn = "SensorOn"
+    SensorTripped = "SensorTripped"
+
+
+class Device:
+    def __init__(self, dev_id, name, props, deviceTypeId="camect"):
+        self.id = dev_id
+        self.name = name
+        self.pluginProps = Dict(props)
+        self.deviceTypeId = deviceTypeId
+        self.states = Dict()
+
+    def updateStateOnServer(self, key, value):
+        self.updateStatesOnServer([{'key': key, 'value': value}])
+
+    def updateStatesOnServer(self, key_value_list):
+        counters.state_writes += 1
+        counters.state_keys += len(key_value_list)
+        for item in key_value_list:
+            self.states[item['key']] = item['value']
+
+    def updateStateImageOnServer(self, image):
+        pass
+
+
+class Trigger:
+    def __init__(self, trigger_id, pluginTypeId, props):
+        self.id = trigger_id
+        self.name = f"Trigger {trigger_id}"
+        self.pluginTypeId = pluginTypeId
+        self.pluginProps = Dict(props)
+
+
+class _Devices(dict):
+    def __getitem__(self, key):
+        return dict.__getitem__(self, int(key))
+
+
+class _TriggerModule:
+    @staticmethod
+    def execute(trigger):
+        counters.trigger_executions += 1
+
+
+class _Server:
+    install_folder = tempfile.mkdtemp(prefix="indigo-")
+
+    def getInstallFolderPath(self):
+        return self.install_folder
+
+
+devices = _Devices()
+trigger = _TriggerModule()
+server = _Server()
+
+
+class PluginBase:
+    class StopThread(Exception):
+        pass
+
+    def __init__(self, pluginId, pluginDisplayName, pluginVersion, pluginPrefs):
+        self.pluginId = pluginId
+        self.pluginDisplayName = pluginDisplayName
+        self.pluginVersion = pluginVersion
+        self.pluginPrefs = Dict(pluginPrefs)
+        self.logger = logging.getLogger("Plugin")
+        self.plugin_file_handler = logging.NullHandler()
+        self.indigo_log_handler = logging.StreamHandler(sys.stderr)
+        self.logger.addHandler(self.indigo_log_handler)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+def install():
+    """ Register this module as `indigo` and add Indigo's threaddebug log level.
+    """
+    if not hasattr(logging.Logger, "threaddebug"):
+        logging.addLevelName(THREADDEBUG, "THREADDEBUG")
+
+        def threaddebug(self, msg, *args, **kwargs):
+            if self.isEnabledFor(THREADDEBUG):
+                self._log(THREADDEBUG, msg, args, **kwargs)
+        logging.Logger.threaddebug = threaddebug
+    sys.modules["indigo"] = sys.modules[__name__]
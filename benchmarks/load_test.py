@@ -0,0 +1,166 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Drive the real Camect client against simulated hubs (sim_hub.py) and measure event throughput,
+reconnect time and snapshot latency.
+
+    python benchmarks/load_test.py --hubs 4 --rate 200 --duration 30
+    python benchmarks/load_test.py --drop-every 5 --duration 30            # reconnect timing
+    python benchmarks/load_test.py --freeze-every 10 --pong-timeout 3      # stale link failover
+    python benchmarks/load_test.py --snapshots 50 --snapshot-kb 4096 --stream
+    python benchmarks/load_test.py --transport asyncio --hubs 8
+
+Requires the plugin's requirements (requests, websocket-client, aiohttp) and openssl.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.join(HERE, "..", "camect.indigoPlugin", "Contents", "Server Plugin"))
+
+import fake_indigo      # noqa: E402
+fake_indigo.install()   # for the threaddebug log level
+
+import sim_hub          # noqa: E402
+from camect import Camect   # noqa: E402
+from health import HealthMonitor    # noqa: E402
+
+
+########################################
+class Delegate:
+    ########################################
+    """ Records what the plugin would see: messages, status changes and errors, with timestamps.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = {}
+        self.lag = []
+        self.down_since = {}
+        self.reconnect_times = []
+        self.errors = 0
+
+    def hub_message(self, dev_id=None, message=None, received=None):
+        with self.lock:
+            self.messages[dev_id] = self.messages.get(dev_id, 0) + 1
+            if received:
+                self.lag.append(time.time() - received)
+
+    def hub_status(self, dev_id=None, status=None):
+        with self.lock:
+            if status == "Connected" and dev_id in self.down_since:
+                self.reconnect_times.append(time.monotonic() - self.down_since.pop(dev_id))
+            elif status == "Closed":
+                self.down_since.setdefault(dev_id, time.monotonic())
+
+    def hub_error(self, dev_id=None, error=None):
+        with self.lock:
+            self.errors += 1
+            self.down_since.setdefault(dev_id, time.monotonic())
+
+
+def percentiles(values):
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    pick = [values[min(len(values) - 1, int(len(values) * p / 100.0))] * 1000.0 for p in (50, 95, 99)]
+    return f"p50 {pick[0]:.1f} ms, p95 {pick[1]:.1f} ms, p99 {pick[2]:.1f} ms, max {values[-1] * 1000.0:.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hubs", type=int, default=2)
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=50.0, help="alerts per second per hub")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to collect events")
+    parser.add_argument("--drop-every", type=float, default=0.0, help="seconds between dropping all websockets")
+    parser.add_argument("--freeze-every", type=float, default=0.0, help="seconds between freezing all websockets")
+    parser.add_argument("--ping-interval", type=float, default=1.0)
+    parser.add_argument("--pong-timeout", type=float, default=3.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--snapshots", type=int, default=20, help="snapshots to time per hub")
+    parser.add_argument("--snapshot-kb", type=int, default=512)
+    parser.add_argument("--stream", action="store_true", help="use snapshot_camera_to_file")
+    parser.add_argument("--transport", choices=["threaded", "asyncio"], default="threaded")
+    parser.add_argument("--port", type=int, default=18443)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    # simulator on its own loop thread
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    context = sim_hub.make_ssl_context()
+    hubs = asyncio.run_coroutine_threadsafe(
+        sim_hub.start_hubs(args.hubs, args.port, context, cameras=args.cameras, rate=args.rate,
+                           snapshot_kb=args.snapshot_kb, latency_ms=args.latency_ms, drop_every=args.drop_every,
+                           freeze_every=args.freeze_every),
+        loop).result()
+
+    delegate = Delegate()
+    transport = None
+    clients = {}
+    threads_before = threading.active_count()
+    start = time.monotonic()
+    for i, (_, _, port) in enumerate(hubs):
+        kwargs = dict(hub_id=i, address="127.0.0.1", port=port, username="admin", password="admin", delegate=delegate,
+                      ping_interval=args.ping_interval, pong_timeout=args.pong_timeout)
+        if args.transport == "asyncio":
+            from camect_async import AsyncCamect, AsyncTransport
+            transport = transport or AsyncTransport()
+            clients[i] = AsyncCamect(transport=transport, **kwargs)
+        else:
+            clients[i] = Camect(**kwargs)
+    for client in clients.values():
+        client.wait_ready(10.0)
+    monitor = HealthMonitor(lambda: clients)
+    print(f"{len(clients)} hubs connected in {time.monotonic() - start:.2f} s, "
+          f"{threading.active_count() - threads_before} client threads")
+
+    time.sleep(args.duration)
+    with delegate.lock:
+        received = sum(delegate.messages.values())
+    sent = sum(hub.events_sent for hub, _, _ in hubs)
+    print(f"events: {sent} sent, {received} delivered, {received / args.duration:,.0f} events/sec")
+    print(f"queue lag: {percentiles(delegate.lag)}")
+    print(f"reconnects: {len(delegate.reconnect_times)}, reconnect time: {percentiles(delegate.reconnect_times)}, "
+          f"errors reported: {delegate.errors}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        times = []
+        for i, client in clients.items():
+            cam_id = hubs[i][0].cameras[0]['id']
+            for n in range(args.snapshots):
+                t0 = time.perf_counter()
+                if args.stream:
+                    ok = client.snapshot_camera_to_file(cam_id, os.path.join(folder, f"{i}-{n}.jpg")) is not None
+                else:
+                    ok = client.snapshot_camera(cam_id) is not None
+                if ok:
+                    times.append(time.perf_counter() - t0)
+        print(f"snapshots: {len(times)} of {args.snapshots * len(clients)}, {percentiles(times)}")
+    for i, client in clients.items():
+        stats = client.connection_stats()
+        health = client.health.stats()
+        print(f"hub {i}: {stats['requests']} requests over {stats['connections']} connections, "
+              f"ping rtt avg {health['rtt_avg_ms']} ms p95 {health['rtt_p95_ms']} ms, "
+              f"{health['stale_count']} stale links, last failover {health['last_failover_s']} s")
+    monitor.stop()
+
+    for client in clients.values():
+        client.close()
+    if transport:
+        transport.close()
+    asyncio.run_coroutine_threadsafe(sim_hub.stop_hubs(hubs), loop).result()
+
+
+if __name__ == "__main__":
+    main()
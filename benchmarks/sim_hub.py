@@ -0,0 +1,239 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Simulated Camect hubs for load and reconnect testing.
+
+Serves the REST endpoints the plugin uses (GetHomeInfo, ListCameras, SnapshotCamera, PTZ, EnableAlert,
+SetOperationMode) and /api/event_ws over HTTPS/WSS, for N hubs on consecutive ports.
+
+    python benchmarks/sim_hub.py --hubs 3 --cameras 16 --rate 50 --port 8443
+    python benchmarks/sim_hub.py --snapshot-kb 2048 --latency-ms 20 --drop-every 30
+    python benchmarks/sim_hub.py --freeze-every 30      # half-open links: connections go silent, no pongs
+    python benchmarks/sim_hub.py --mdns                 # advertise the hubs as _camect._tcp for discovery
+
+A self-signed certificate is generated with openssl unless --cert/--key are given.  Requires aiohttp, and
+zeroconf for --mdns.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp import web, WSMsgType
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "camect.indigoPlugin", "Contents", "Server Plugin"))
+
+from discovery import SERVICE_TYPE    # noqa: E402
+
+OBJECTS = ["person", "car", "truck", "dog", "cat", "bicycle", "package"]
+
+
+def make_ssl_context(cert=None, key=None):
+    if not cert:
+        folder = tempfile.mkdtemp(prefix="sim-hub-")
+        cert, key = os.path.join(folder, "cert.pem"), os.path.join(folder, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2",
+                        "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+########################################
+class SimulatedHub:
+    ########################################
+
+    def __init__(self, index, cameras=8, rate=10.0, snapshot_kb=256, latency_ms=0.0, drop_every=0.0, freeze_every=0.0,
+                 seed=None):
+        self.index = index
+        self.rate = rate
+        self.latency = latency_ms / 1000.0
+        self.drop_every = drop_every
+        self.freeze_every = freeze_every
+        self.frozen = set()         # sockets that no longer answer pings or get events
+        self.rng = random.Random(seed if seed is not None else index)
+        self.mode = "DEFAULT"
+        self.cameras = [{'id': f"sim{index}cam{i}", 'name': f"Sim {index} Camera {i}", 'disabled': False,
+                         'is_alert_disabled': False, 'width': 3840, 'height': 2160, 'make': "Sim", 'model': "Cam"}
+                        for i in range(cameras)]
+        self.snapshot = json.dumps({'jpeg_data': base64.b64encode(os.urandom(snapshot_kb * 1024)).decode()}).encode()
+        self.sockets = set()
+        self.events_sent = 0
+        self.requests = {}
+
+        self.app = web.Application()
+        self.app.router.add_get("/api/event_ws", self.event_ws)
+        self.app.router.add_get("/api/{call}", self.api)
+        self.app.on_shutdown.append(self._close_sockets)
+
+    async def api(self, request):
+        call = request.match_info['call']
+        self.requests[call] = self.requests.get(call, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if call == "GetHomeInfo":
+            return web.json_response({'name': f"Sim Hub {self.index}", 'id': f"simhub{self.index}",
+                                      'cloud_url': "", 'local_https_url': f"https://{request.host}",
+                                      'mode': self.mode, 'object_name': OBJECTS})
+        if call == "ListCameras":
+            return web.json_response({'camera': self.cameras})
+        if call == "SnapshotCamera":
+            return web.Response(body=self.snapshot, content_type="application/json")
+        if call == "SetOperationMode":
+            self.mode = request.query.get("Mode", self.mode)
+            self._broadcast({'type': "mode", 'desc': self.mode})
+            return web.json_response({})
+        if call == "EnableAlert":
+            enable = request.query.get("Enable") == "1"
+            cam_ids = [value for key, value in request.query.items() if key.startswith("CamId[")]
+            for camera in self.cameras:
+                if camera['id'] in cam_ids:
+                    camera['is_alert_disabled'] = not enable
+                    self._broadcast({'type': "alert_enabled" if enable else "alert_disabled",
+                                     'cam_id': camera['id'], 'cam_name': camera['name']})
+            return web.json_response({})
+        if call == "PTZ":
+            return web.json_response({})
+        raise web.HTTPNotFound()
+
+    async def event_ws(self, request):
+        ws = web.WebSocketResponse(heartbeat=None, autoping=False)
+        await ws.prepare(request)
+        self.sockets.add(ws)
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.PING and ws not in self.frozen:
+                    await ws.pong(msg.data)
+                elif msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            self.sockets.discard(ws)
+            self.frozen.discard(ws)
+        return ws
+
+    def _broadcast(self, event):
+        message = json.dumps(event)
+        for ws in list(self.sockets):
+            if not ws.closed and ws not in self.frozen:
+                asyncio.ensure_future(ws.send_str(message))
+                self.events_sent += 1
+
+    def make_alert(self):
+        camera = self.rng.choice(self.cameras)
+        objects = self.rng.sample(OBJECTS, self.rng.randint(1, 2))
+        return {'type': "alert", 'cam_id': camera['id'], 'cam_name': camera['name'],
+                'desc': f"{camera['name']} just saw {', '.join(objects)}.",
+                'url': f"https://local.camect.com/sim/{self.events_sent}", 'detected_obj': objects}
+
+    async def generate(self):
+        """ Send alerts at the configured rate, drop all connections every drop_every seconds, and freeze
+        the current connections every freeze_every seconds.
+        """
+        next_drop = time.monotonic() + self.drop_every if self.drop_every else None
+        next_freeze = time.monotonic() + self.freeze_every if self.freeze_every else None
+        interval = 1.0 / self.rate if self.rate > 0 else None
+        while True:
+            await asyncio.sleep(interval or 1.0)
+            if interval:
+                self._broadcast(self.make_alert())
+            if next_drop and time.monotonic() >= next_drop:
+                next_drop = time.monotonic() + self.drop_every
+                await self.drop_connections()
+            if next_freeze and time.monotonic() >= next_freeze:
+                next_freeze = time.monotonic() + self.freeze_every
+                self.frozen.update(self.sockets)
+
+    async def drop_connections(self):
+        for ws in list(self.sockets):
+            await ws.close()
+
+    async def _close_sockets(self, app):
+        await self.drop_connections()
+
+
+async def start_hubs(count, port, ssl_context, **kwargs):
+    """ Start count hubs on consecutive ports, returns [(hub, runner, port)].
+    """
+    hubs = []
+    for i in range(count):
+        hub = SimulatedHub(i, **kwargs)
+        runner = web.AppRunner(hub.app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port + i, ssl_context=ssl_context).start()
+        hub.task = asyncio.ensure_future(hub.generate())
+        hubs.append((hub, runner, port + i))
+    return hubs
+
+
+async def advertise_hubs(hubs, address="127.0.0.1"):
+    """ Register each hub over mDNS the way discovery.py expects: SERVICE_TYPE, with the hub id as the "id"
+    TXT property.  Returns the AsyncZeroconf instance, close it with async_close().
+    """
+    from zeroconf import IPVersion, ServiceInfo
+    from zeroconf.asyncio import AsyncZeroconf
+
+    zeroconf = AsyncZeroconf(ip_version=IPVersion.V4Only)
+    for hub, _, port in hubs:
+        await zeroconf.async_register_service(ServiceInfo(
+            SERVICE_TYPE, f"Sim Hub {hub.index}.{SERVICE_TYPE}", port=port, addresses=[socket.inet_aton(address)],
+            properties={'id': f"simhub{hub.index}"}, server=f"simhub{hub.index}.local."))
+    return zeroconf
+
+
+async def stop_hubs(hubs):
+    for hub, runner, _ in hubs:
+        hub.task.cancel()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hubs", type=int, default=1)
+    parser.add_argument("--cameras", type=int, default=8, help="cameras per hub")
+    parser.add_argument("--rate", type=float, default=10.0, help="alerts per second per hub")
+    parser.add_argument("--snapshot-kb", type=int, default=256, help="decoded snapshot size")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added latency for REST calls")
+    parser.add_argument("--drop-every", type=float, default=0.0, help="seconds between dropping all websockets")
+    parser.add_argument("--freeze-every", type=float, default=0.0, help="seconds between freezing all websockets")
+    parser.add_argument("--port", type=int, default=8443, help="port of the first hub")
+    parser.add_argument("--mdns", action="store_true", help="advertise the hubs over mDNS")
+    parser.add_argument("--cert")
+    parser.add_argument("--key")
+    args = parser.parse_args()
+
+    async def serve():
+        hubs = await start_hubs(args.hubs, args.port, make_ssl_context(args.cert, args.key),
+                                cameras=args.cameras, rate=args.rate, snapshot_kb=args.snapshot_kb,
+                                latency_ms=args.latency_ms, drop_every=args.drop_every, freeze_every=args.freeze_every)
+        for hub, _, port in hubs:
+            print(f"Sim Hub {hub.index}: https://127.0.0.1:{port}/api/ ({len(hub.cameras)} cameras)")
+        zeroconf = await advertise_hubs(hubs) if args.mdns else None
+        try:
+            while True:
+                await asyncio.sleep(10.0)
+                print(", ".join(f"hub {hub.index}: {hub.events_sent} events, {len(hub.sockets)} clients"
+                                for hub, _, _ in hubs))
+        finally:
+            if zeroconf:
+                await zeroconf.async_close()
+            await stop_hubs(hubs)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
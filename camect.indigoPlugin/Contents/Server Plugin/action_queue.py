@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import logging
+import threading
+import time
+from collections import deque
+
+from metrics import LatencyHistogram
+
+DEFAULT_ACTION_QUEUE_SIZE = 64
+
+
+########################################
+class ActionQueue:
+    ########################################
+    """ Per-hub worker for action requests, so Indigo's action thread returns as soon as the action is queued.
+
+    Each request has a key describing what it does, and a coalesce key naming what it acts on (the key
+    itself if none is given).  A request replaces a queued (not yet running) request with the same coalesce
+    key, so a burst of PTZ moves for one camera collapses to the latest move, and HOME, AWAY, HOME ends on
+    HOME.  A request is only dropped as a duplicate when it is the same as the last request for its coalesce
+    key, queued or, if none is queued, running.
+    """
+
+    def __init__(self, name, max_size=DEFAULT_ACTION_QUEUE_SIZE):
+        self.logger = logging.getLogger("Plugin.ActionQueue")
+        self.name = name
+        self.max_size = max(1, max_size)
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.latency = LatencyHistogram()       # submit to completion, ms
+
+        self._queue = deque()           # [submitted, key, coalesce key, func, args]
+        self._running = None            # (key, coalesce key) of the request being run
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=f"Actions-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, func, *args, coalesce=None):
+        """ Queue func(*args).  Returns False if the request was dropped as a duplicate or the queue is full.
+        """
+        with self._cond:
+            if self._stopped:
+                return False
+            if coalesce is None:
+                coalesce = key
+            queued = next((job for job in self._queue if job[2] == coalesce), None)
+            if queued:
+                last = queued[1]
+            elif self._running and self._running[1] == coalesce:
+                last = self._running[0]
+            else:
+                last = None
+            if key == last:
+                self.duplicates += 1
+                return False
+            self.submitted += 1
+            if queued:
+                # keep the original submit time, so latency still measures the oldest wait
+                queued[1], queued[3], queued[4] = key, func, args
+                self.coalesced += 1
+                return True
+            if len(self._queue) >= self.max_size:
+                self.rejected += 1
+                self.logger.warning(f"{self.name}: action queue full, {key[0]} request dropped")
+                return False
+            self._queue.append([time.perf_counter(), key, coalesce, func, args])
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify()
+            return True
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+    def depth(self):
+        return len(self._queue)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'depth': len(self._queue),
+                'max_depth': self.max_depth,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'coalesced': self.coalesced,
+                'duplicates': self.duplicates,
+                'rejected': self.rejected,
+                'latency_p50_ms': self.latency.percentile(50),
+                'latency_p95_ms': self.latency.percentile(95),
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                submitted, key, coalesce, func, args = self._queue.popleft()
+                self._running = (key, coalesce)
+
+            failed = False
+            try:
+                func(*args)
+            except Exception as err:
+                failed = True
+                self.logger.exception(f"{self.name}: {key[0]} action error: {err}")
+
+            with self._cond:
+                self._running = None
+                self.completed += 1
+                if failed:
+                    self.failed += 1
+                self.latency.record((time.perf_counter() - submitted) * 1000.0)
@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import threading
+
+
+########################################
+class AlertState:
+    ########################################
+    """ Tracks per-camera alert state, from alert_enabled/alert_disabled events and the EnableAlert calls
+    the plugin made, so calls that would not change anything can be skipped.
+
+    Camect keys each disable by its reason, so a disable is only a no-op if the camera is disabled and
+    the plugin already disabled it with the same reason.  An enable is a no-op if alerts are known to be on.
+    """
+
+    def __init__(self):
+        self._enabled = {}          # (hub_id, cam_id) -> True / False, missing if unknown
+        self._reasons = {}          # (hub_id, cam_id) -> set of reasons the plugin disabled it with
+        self._lock = threading.Lock()
+
+    def event(self, hub_id, cam_id, enabled):
+        with self._lock:
+            self._enabled[(hub_id, cam_id)] = enabled
+            if enabled:
+                self._reasons.pop((hub_id, cam_id), None)
+
+    def known(self, hub_id, cam_id):
+        return self._enabled.get((hub_id, cam_id))
+
+    def needed(self, hub_id, cam_ids, enable, reason):
+        """ The subset of cam_ids for which the call would change something.
+        """
+        with self._lock:
+            result = []
+            for cam_id in cam_ids:
+                key = (hub_id, cam_id)
+                if enable and self._enabled.get(key) is True:
+                    continue
+                if not enable and self._enabled.get(key) is False and reason in self._reasons.get(key, ()):
+                    continue
+                result.append(cam_id)
+            return result
+
+    def applied(self, hub_id, cam_ids, enable, reason):
+        """ Record a successful EnableAlert call.  The resulting state is left to the hub's events, since
+        an enable only lifts this reason's disable.
+        """
+        with self._lock:
+            for cam_id in cam_ids:
+                key = (hub_id, cam_id)
+                if enable:
+                    self._reasons.get(key, set()).discard(reason)
+                else:
+                    self._reasons.setdefault(key, set()).add(reason)
+                    self._enabled[key] = False
+
+    def forget_hub(self, hub_id):
+        with self._lock:
+            for key in [key for key in self._enabled if key[0] == hub_id]:
+                del self._enabled[key]
+            for key in [key for key in self._reasons if key[0] == hub_id]:
+                del self._reasons[key]
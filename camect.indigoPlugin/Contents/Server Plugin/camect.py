@@ -4,100 +4,293 @@
 import base64
 import json
 import logging
+import os
+import random
 import ssl
 import sys
+import tempfile
 import time
 
 import requests
 import websocket
 import threading
 
+from event_queue import EventQueue, DEFAULT_QUEUE_SIZE, DROP_OLDEST
+from snapshot_stream import JsonBase64Decoder
+from health import LinkHealth, DEFAULT_PING_INTERVAL, DEFAULT_PONG_TIMEOUT
+
 requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
 
+DEFAULT_POOL_SIZE = 4           # keep-alive connections per hub
+DEFAULT_RETRIES = 2             # retries for idempotent API calls
+DEFAULT_TIMEOUT = 10.0          # seconds
+SNAPSHOT_CHUNK_SIZE = 64 * 1024
+BACKOFF_BASE = 1.0              # seconds before the first reconnect attempt
+BACKOFF_MAX = 60.0              # max seconds between reconnect attempts
+THREADDEBUG = 5                 # Indigo's threaddebug log level
+
 
 ########################################
-class Camect:
+class CamectAPI:
     ########################################
+    """ Camect REST API calls, shared by the threaded and asyncio clients.
+
+    Subclasses provide _do_request(), returning a response with status_code and json(), or None on failure.
+    """
+
+    def get_info(self):
+        resp = self._do_request("GetHomeInfo", idempotent=True)
+        if not resp:
+            return None
+        return resp.json()
+
+    def set_mode(self, mode):
+        self._do_request("SetOperationMode")
+        return mode
+
+    def list_cameras(self):
+        resp = self._do_request("ListCameras", idempotent=True)
+        if not resp:
+            return None
+        return resp.json()["camera"]
+
+    def ptz(self, cam_id, action):
+        params = {"CamId": cam_id, "Action": action}
+        self._do_request("PTZ", params)
+        return
+
+    def snapshot_camera(self, cam_id, width=0, height=0):
+        params = {"CamId": cam_id, "Width": str(width), "Height": str(height)}
+        resp = self._do_request("SnapshotCamera", params, idempotent=True)
+        if not resp:
+            return None
+        return base64.b64decode(resp.json()["jpeg_data"])
+
+    def disable_alert(self, cam_ids, reason):
+        """ Disable alerts for camera(s) or the home if "cam_ids" is empty.
+        """
+        return self._enable_alert(cam_ids, False, reason)
 
-    def __init__(self, *, hub_id, address, port, username, password, delegate):
+    def enable_alert(self, cam_ids, reason):
+        """ Enable alerts for camera(s) or the home if "cam_ids" is empty.
+
+        NOTE: This method can only undo disable_alert. It has no effect if disable_alert was not
+        called before.
+        Please make sure that "reason" is same as you called disable_alert.
+        """
+        return self._enable_alert(cam_ids, True, reason)
+
+    def _enable_alert(self, cam_ids, enable, reason):
+        params = {"Reason": reason}
+        if enable:
+            params["Enable"] = "1"
+        for i in range(len(cam_ids)):
+            key = f"CamId[{i:d}]"
+            params[key] = cam_ids[i]
+
+        if self._do_request("EnableAlert", params) is None:
+            return None
+        return reason
+
+
+########################################
+class Camect(CamectAPI):
+    ########################################
+
+    def __init__(self, *, hub_id, address, port, username, password, delegate,
+                 pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, timeout=DEFAULT_TIMEOUT,
+                 queue_size=DEFAULT_QUEUE_SIZE, queue_policy=DROP_OLDEST, event_filter=None,
+                 ping_interval=DEFAULT_PING_INTERVAL, pong_timeout=DEFAULT_PONG_TIMEOUT):
         self.logger = logging.getLogger("Plugin.Camect")
 
         self.hub_id = hub_id
         self.delegate = delegate
+        self.event_filter = event_filter
         self.ready = False
-        self.thread_start_delay = 0.0
-
+        self._ready_event = threading.Event()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._attempt = 0
+        self.reconnects = 0
+        self.ws = None
+        self.retries = retries
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.health = LinkHealth()
+
+        self.address = address
+        self.port = port
+        self.connected_address = None       # address of the last websocket that opened
         self._api_prefix = f"https://{address}:{port}/api/"
         self._ws_uri = f"wss://{address}:{port}/api/event_ws"
         self.authorization = f"Basic {base64.b64encode(f'{username}:{password}'.encode()).decode()}"
 
+        # persistent keep-alive connection pool for the REST API
+        self._session = requests.Session()
+        self._session.verify = False
+        self._session.headers.update({'Authorization': self.authorization})
+        self._adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount("https://", self._adapter)
+
+        # events are handed to the delegate on a separate worker, so a slow delegate can't stall the websocket
+        self.events = EventQueue(str(hub_id), self._dispatch, max_size=queue_size, policy=queue_policy)
+
         ################################################################################
         # Minimal Websocket Client
         ################################################################################
 
-        def ws_client():
-            self.logger.debug(f"Device {self.hub_id} connecting to '{self._ws_uri}'")
-
-            self.ws = websocket.WebSocketApp(self._ws_uri, header={'Authorization': self.authorization},
-                                             on_message=on_message,
-                                             on_error=on_error,
-                                             on_close=on_close,
-                                             on_open=on_open)
-
-            self.ws.run_forever(ping_interval=5, sslopt={"cert_reqs": ssl.CERT_NONE, "check_hostname": False})
+        def supervisor():
+            # owns the websocket for the life of this object: connect, run until it drops, back off, repeat
+            while not self._stop.is_set():
+                self.logger.debug(f"Device {self.hub_id} connecting to '{self._ws_uri}'")
+
+                self.ws = websocket.WebSocketApp(self._ws_uri, header={'Authorization': self.authorization},
+                                                 on_message=on_message,
+                                                 on_error=on_error,
+                                                 on_close=on_close,
+                                                 on_open=on_open,
+                                                 on_pong=on_pong)
+
+                # reconnect=0: the library's own reconnect loop is off, this supervisor does the backoff
+                self.ws.run_forever(ping_interval=self.ping_interval, reconnect=0,
+                                    sslopt={"cert_reqs": ssl.CERT_NONE, "check_hostname": False})
+                if self._stop.is_set():
+                    break
+
+                # exponential backoff with jitter, reset by a successful on_open
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** self._attempt) * random.uniform(0.5, 1.0)
+                self._attempt += 1
+                self.reconnects += 1
+                self.logger.debug(f"{self.hub_id}: reconnecting websocket in {delay:.1f} seconds")
+                self._wakeup.wait(delay)
+                self._wakeup.clear()
 
         def on_open(ws):
             self.logger.debug(f"{self.hub_id}: websocket on_open")
+            if self._stop.is_set():     # closed while this connection was being opened
+                ws.close()
+                return
             self.ready = True
+            self._attempt = 0
+            self._ready_event.set()
+            self.connected_address = self.address
+            self.health.connected()
             self.delegate.hub_status(dev_id=self.hub_id, status="Connected")
 
-        def on_message(ws, message):
-            self.logger.threaddebug(f"{self.hub_id}: websocket on_message: {message}")
-            self.delegate.hub_message(dev_id=self.hub_id, message=message)
+        def on_pong(ws, data):
+            if ws.last_ping_tm:
+                self.health.pong(time.time() - ws.last_ping_tm)
 
-        def on_close(ws):
+        def on_message(ws, message):
+            self.health.frame()
+            if self.event_filter and not self.event_filter.accept(message):
+                return
+            if self.logger.isEnabledFor(THREADDEBUG):
+                self.logger.threaddebug(f"{self.hub_id}: websocket on_message: {message}")
+            self.events.put(message)
+
+        def on_close(ws, close_status_code=None, close_msg=None):
             self.logger.debug(f"{self.hub_id}: websocket on_close")
             self.ready = False
-            self.delegate.hub_status(dev_id=self.hub_id, status="Closed")
+            self._ready_event.clear()
+            self.health.disconnected()
+            if not self._stop.is_set():
+                self.delegate.hub_status(dev_id=self.hub_id, status="Closed")
 
         def on_error(ws, error):
             self.logger.debug(f"{self.hub_id}: websocket on_error: {error}")
             self.ready = False
-            self.delegate.hub_error(dev_id=self.hub_id, error=error)
-
-            if self.thread.is_alive():
-                self.logger.debug(f"{self.hub_id}: websocket thread is still alive!")
-
-            # try to recover from the error
-            self.thread_start_delay += 10.0 if self.thread_start_delay < 50.0 else 60.0   # wait 10 more seconds, max 1 minute
-
-            self.thread = threading.Thread(target=ws_client)
-            self.logger.debug(f"{self.hub_id}: restarting websocket thread in {self.thread_start_delay} seconds")
-            threading.Timer(self.thread_start_delay, lambda: self.thread.start()).start()
+            self._ready_event.clear()
+            self.health.disconnected()
+            if not self._stop.is_set():
+                self.delegate.hub_error(dev_id=self.hub_id, error=error)
 
         ################################################################################
 
-        # start up the websocket.old receiver thread
+        # start up the websocket supervisor thread
 
-        self.thread = threading.Thread(target=ws_client).start()
+        self.thread = threading.Thread(target=supervisor, name=f"Camect-{hub_id}", daemon=True)
+        self.thread.start()
         self.delegate.hub_status(dev_id=self.hub_id, status="Started")
 
+    def close(self, timeout=5.0):
+        """ Stop the websocket supervisor and event worker, and wait for their threads to exit.
+        """
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._drop_websocket()
+        self.events.stop(timeout=timeout)
+        if threading.current_thread() is not self.thread:
+            self.thread.join(timeout)
+        self._session.close()
+
+    def set_address(self, address, port):
+        """ Point the client at a new address and reconnect the websocket now, skipping any backoff.
+        """
+        if (address, str(port)) == (self.address, str(self.port)):
+            return
+        self.logger.debug(f"{self.hub_id}: address changed to {address}:{port}")
+        self.address = address
+        self.port = port
+        self._api_prefix = f"https://{address}:{port}/api/"
+        self._ws_uri = f"wss://{address}:{port}/api/event_ws"
+        self.reconnect()
+
+    def reconnect(self):
+        """ Drop the websocket and connect again at once, skipping any backoff.
+        """
+        self._attempt = 0
+        self._wakeup.set()
+        self._drop_websocket()
+
+    def _drop_websocket(self):
+        # don't wait for the hub's close frame, the link may be dead.  Shutting the socket down wakes the read
+        # loop, which sees keep_running is off and tears down (stopping the ping thread and calling on_close)
+        ws = self.ws
+        if ws:
+            ws.keep_running = False
+            if ws.sock and ws.sock.connected:
+                ws.sock.abort()
+
     def __del__(self):
-        self.ws.close()
+        self.close(timeout=1.0)
+
+    def live_threads(self):
+        ws = self.ws
+        threads = [self.thread, self.events._thread, ws.ping_thread if ws else None]
+        return sum(1 for thread in threads if thread is not None and thread.is_alive())
+
+    def wait_ready(self, timeout=None):
+        """ Block until the websocket is open, returns False if it didn't open within timeout seconds.
+        """
+        return self._ready_event.wait(timeout)
+
+    def _dispatch(self, message, received, source=None):
+        self.delegate.hub_message(dev_id=self.hub_id, message=message, received=received)
 
     ################################################################################
     # API Functions
     ################################################################################
 
-    def _do_request(self, api_call, params=None):
+    def _do_request(self, api_call, params=None, timeout=None, idempotent=False, stream=False):
         self.logger.debug(f"{self.hub_id}: _do_request api_call = {api_call}, params = {params}")
-        try:
-            resp = requests.get(self._api_prefix + api_call, timeout=10.0, verify=False, headers={'Authorization': self.authorization}, params=params)
-        except requests.exceptions.ConnectionError as err:
-            self.delegate.hub_error(dev_id=self.hub_id, error=f"{api_call} request failure")
-            return None
-        except requests.exceptions.Timeout as err:
-            self.delegate.hub_error(dev_id=self.hub_id, error=f"{api_call} timeout")
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(attempts):
+            try:
+                # verify is passed per request, a session level verify=False is overridden by REQUESTS_CA_BUNDLE
+                resp = self._session.get(self._api_prefix + api_call, timeout=timeout or self.timeout, params=params,
+                                         stream=stream, verify=False)
+                break
+            except requests.exceptions.Timeout as err:
+                error = f"{api_call} timeout"
+            except requests.exceptions.ConnectionError as err:
+                error = f"{api_call} request failure"
+            self.logger.debug(f"{self.hub_id}: _do_request {error}, attempt {attempt + 1} of {attempts}")
+        else:
+            self.delegate.hub_error(dev_id=self.hub_id, error=error)
             return None
         if resp.status_code != 200:
             self.delegate.hub_error(dev_id=self.hub_id, error=f"{api_call} Error, status code: {resp.status_code}")
@@ -106,50 +299,42 @@ class Camect:
 
         return resp
 
-    def get_info(self):
-        return self._do_request("GetHomeInfo").json()
-
-    def set_mode(self, mode):
-        self._do_request("SetOperationMode")
-        return mode
-
-    def list_cameras(self):
-        resp_json = self._do_request("ListCameras").json()
-        return resp_json["camera"]
-
-    def ptz(self, cam_id, action):
-        params = {"CamId": cam_id, "Action": action}
-        self._do_request("PTZ", params)
-        return
-
-    def snapshot_camera(self, cam_id, width=0, height=0):
+    def connection_stats(self):
+        """ Number of connections opened and requests made through the REST connection pool.
+        """
+        # requests keys its pools by TLS settings as well as host, so total over all of them
+        pools = self._adapter.poolmanager.pools
+        stats = {'connections': 0, 'requests': 0}
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                stats['connections'] += pool.num_connections
+                stats['requests'] += pool.num_requests
+        return stats
+
+    def snapshot_camera_to_file(self, cam_id, save_path, width=0, height=0):
+        """ Stream the snapshot straight to save_path, decoding the image as it arrives.  The file is
+        written to a temp file and renamed into place.  Returns the image size, or None on failure.
+        """
         params = {"CamId": cam_id, "Width": str(width), "Height": str(height)}
-        resp = self._do_request("SnapshotCamera", params)
+        resp = self._do_request("SnapshotCamera", params, idempotent=True, stream=True)
         if not resp:
             return None
-        return base64.b64decode(resp.json()["jpeg_data"])
-
-    def disable_alert(self, cam_ids, reason):
-        """ Disable alerts for camera(s) or the home if "cam_ids" is empty.
-        """
-        return self._enable_alert(cam_ids, False, reason)
-
-    def enable_alert(self, cam_ids, reason):
-        """ Enable alerts for camera(s) or the home if "cam_ids" is empty.
-
-        NOTE: This method can only undo disable_alert. It has no effect if disable_alert was not
-        called before.
-        Please make sure that "reason" is same as you called disable_alert.
-        """
-        return self._enable_alert(cam_ids, True, reason)
 
-    def _enable_alert(self, cam_ids, enable, reason):
-        params = {"Reason": reason}
-        if enable:
-            params["Enable"] = "1"
-        for i in range(len(cam_ids)):
-            key = f"CamId[{i:d}]"
-            params[key] = cam_ids[i]
-
-        resp_json = self._do_request("EnableAlert", params).json()
-        return reason
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(save_path), suffix=".tmp")
+            with os.fdopen(fd, 'wb') as f:
+                decoder = JsonBase64Decoder(f)
+                for chunk in resp.iter_content(SNAPSHOT_CHUNK_SIZE):
+                    decoder.feed(chunk)
+                decoder.close()
+            os.replace(temp_path, save_path)
+        except (ValueError, OSError, requests.exceptions.RequestException) as err:
+            self.delegate.hub_error(dev_id=self.hub_id, error=f"SnapshotCamera stream error: {err}")
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return None
+        finally:
+            resp.close()
+        return decoder.bytes_written
@@ -0,0 +1,331 @@
+# asyncio transport for the Camect client.
+# All hubs share one event loop thread for their websocket and REST traffic.
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+from camect import CamectAPI, DEFAULT_POOL_SIZE, DEFAULT_RETRIES, DEFAULT_TIMEOUT, SNAPSHOT_CHUNK_SIZE, BACKOFF_BASE, BACKOFF_MAX, THREADDEBUG
+from event_queue import EventQueue, DEFAULT_QUEUE_SIZE, DROP_OLDEST
+from snapshot_stream import JsonBase64Decoder
+from health import LinkHealth, DEFAULT_PING_INTERVAL, DEFAULT_PONG_TIMEOUT
+
+CLOSE_TIMEOUT = 2.0         # seconds to wait for the hub's close frame
+
+
+########################################
+class AsyncTransport:
+    ########################################
+    """ Event loop thread shared by all AsyncCamect hubs.  Each hub has its own event queue and dispatch worker,
+    so a slow or flooding hub doesn't hold up or push out the others' events.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger("Plugin.AsyncTransport")
+        self.hubs = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="CamectAsync", daemon=True)
+        self.thread.start()
+
+    def run(self, coro, timeout=None):
+        """ Run a coroutine on the loop from another thread and wait for the result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self, timeout=5.0):
+        for hub in list(self.hubs.values()):
+            hub.close(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+
+########################################
+class _Response:
+    ########################################
+    # the parts of requests.Response that CamectAPI uses
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode(errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+########################################
+class AsyncCamect(CamectAPI):
+    ########################################
+    """ Same interface as Camect, with the websocket and REST calls running on the shared AsyncTransport loop.
+    """
+
+    def __init__(self, *, hub_id, address, port, username, password, delegate, transport,
+                 pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, timeout=DEFAULT_TIMEOUT,
+                 queue_size=DEFAULT_QUEUE_SIZE, queue_policy=DROP_OLDEST, event_filter=None,
+                 ping_interval=DEFAULT_PING_INTERVAL, pong_timeout=DEFAULT_PONG_TIMEOUT):
+        self.logger = logging.getLogger("Plugin.AsyncCamect")
+
+        self.hub_id = hub_id
+        self.delegate = delegate
+        self.transport = transport
+        self.events = EventQueue(str(hub_id), self._dispatch, max_size=queue_size, policy=queue_policy)
+        self.event_filter = event_filter
+        self.ready = False
+        self._ready_event = threading.Event()
+        self._stopped = False
+        self._attempt = 0
+        self.reconnects = 0
+        self.retries = retries
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.pong_timeout = pong_timeout
+        self.health = LinkHealth()
+        self._ping_sent = None
+        self._connections = 0
+        self._requests = 0
+        self._ws = None
+        self._wakeup = None
+
+        self.address = address
+        self.port = port
+        self.connected_address = None       # address of the last websocket that opened
+        self._api_prefix = f"https://{address}:{port}/api/"
+        self._ws_uri = f"wss://{address}:{port}/api/event_ws"
+        self.authorization = f"Basic {base64.b64encode(f'{username}:{password}'.encode()).decode()}"
+
+        transport.hubs[hub_id] = self
+        self._session = transport.run(self._create_session(pool_size))
+        self._task = transport.submit(self._supervisor())
+        self.delegate.hub_status(dev_id=self.hub_id, status="Started")
+
+    async def _create_session(self, pool_size):
+        self._wakeup = asyncio.Event()
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(self._on_connection)
+        trace.on_request_start.append(self._on_request)
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size, ssl=False),
+                                     headers={'Authorization': self.authorization}, trace_configs=[trace])
+
+    async def _on_connection(self, session, context, params):
+        self._connections += 1
+
+    async def _on_request(self, session, context, params):
+        self._requests += 1
+
+    def close(self, timeout=5.0):
+        if self._stopped:
+            return
+        self._stopped = True
+        self.transport.hubs.pop(self.hub_id, None)
+        try:
+            self.transport.run(self._close(), timeout)
+        except Exception as err:
+            self.logger.debug(f"{self.hub_id}: close error: {err}")
+        self.events.stop(timeout)
+
+    async def _close(self):
+        self._task.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+        await self._session.close()
+
+    def set_address(self, address, port):
+        """ Point the client at a new address and reconnect the websocket now, skipping any backoff.
+        """
+        if (address, str(port)) == (self.address, str(self.port)):
+            return
+        self.logger.debug(f"{self.hub_id}: address changed to {address}:{port}")
+        self.address = address
+        self.port = port
+        self._api_prefix = f"https://{address}:{port}/api/"
+        self._ws_uri = f"wss://{address}:{port}/api/event_ws"
+        self.reconnect()
+
+    def reconnect(self):
+        """ Drop the websocket and connect again at once, skipping any backoff.
+        """
+        self._attempt = 0
+        self.transport.submit(self._reconnect())
+
+    async def _reconnect(self):
+        self._wakeup.set()
+        if self._ws is not None:
+            await self._ws.close()
+
+    def live_threads(self):
+        # the loop thread is shared by all hubs
+        return sum(1 for thread in (self.transport.thread, self.events._thread) if thread.is_alive())
+
+    def wait_ready(self, timeout=None):
+        return self._ready_event.wait(timeout)
+
+    def _dispatch(self, message, received, source=None):
+        self.delegate.hub_message(dev_id=self.hub_id, message=message, received=received)
+
+    ################################################################################
+    # Websocket
+    ################################################################################
+
+    async def _status(self, status=None, error=None):
+        # delegate calls block on the Indigo server, keep them off the loop thread
+        loop = asyncio.get_running_loop()
+        if error is not None:
+            await loop.run_in_executor(None, lambda: self.delegate.hub_error(dev_id=self.hub_id, error=error))
+        else:
+            await loop.run_in_executor(None, lambda: self.delegate.hub_status(dev_id=self.hub_id, status=status))
+
+    async def _supervisor(self):
+        pinger = None
+        while not self._stopped:
+            self.logger.debug(f"Device {self.hub_id} connecting to '{self._ws_uri}'")
+            try:
+                # pings are sent and pongs handled here rather than by aiohttp, to measure the round trip
+                async with self._session.ws_connect(self._ws_uri, autoping=False, timeout=CLOSE_TIMEOUT, ssl=False) as ws:
+                    self._ws = ws
+                    self.logger.debug(f"{self.hub_id}: websocket open")
+                    self.ready = True
+                    self._attempt = 0
+                    self._ready_event.set()
+                    self.connected_address = self.address
+                    self.health.connected()
+                    self._ping_sent = None
+                    if self.ping_interval > 0:
+                        pinger = asyncio.ensure_future(self._pinger(ws))
+                    await self._status(status="Connected")
+
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.PONG:
+                            if self._ping_sent is not None:
+                                self.health.pong(time.monotonic() - self._ping_sent)
+                            continue
+                        if msg.type == aiohttp.WSMsgType.PING:
+                            await ws.pong(msg.data)
+                            continue
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self.health.frame()
+                            if self.event_filter and not self.event_filter.accept(msg.data):
+                                continue
+                            if self.logger.isEnabledFor(THREADDEBUG):
+                                self.logger.threaddebug(f"{self.hub_id}: websocket message: {msg.data}")
+                            self.events.put(msg.data)
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            raise ws.exception()
+                if not self._stopped:
+                    await self._status(status="Closed")
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self.logger.debug(f"{self.hub_id}: websocket error: {err}")
+                if not self._stopped:
+                    await self._status(error=str(err))
+            finally:
+                if pinger is not None:
+                    pinger.cancel()
+                    pinger = None
+                self._ws = None
+                self.ready = False
+                self._ready_event.clear()
+                self.health.disconnected()
+
+            if self._stopped:
+                break
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** self._attempt) * random.uniform(0.5, 1.0)
+            self._attempt += 1
+            self.reconnects += 1
+            self.logger.debug(f"{self.hub_id}: reconnecting websocket in {delay:.1f} seconds")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _pinger(self, ws):
+        try:
+            while not ws.closed:
+                await asyncio.sleep(self.ping_interval)
+                self._ping_sent = time.monotonic()
+                await ws.ping()
+        except (ConnectionError, RuntimeError) as err:
+            self.logger.debug(f"{self.hub_id}: websocket ping error: {err}")
+
+    ################################################################################
+    # API Functions
+    ################################################################################
+
+    def _do_request(self, api_call, params=None, timeout=None, idempotent=False):
+        self.logger.debug(f"{self.hub_id}: _do_request api_call = {api_call}, params = {params}")
+        timeout = timeout or self.timeout
+        try:
+            status, content, error = self.transport.run(self._request(api_call, params, timeout, idempotent), timeout * (self.retries + 2))
+        except Exception as err:
+            status, content, error = None, None, f"{api_call} request failure: {err}"
+        if error:
+            self.delegate.hub_error(dev_id=self.hub_id, error=error)
+            return None
+        if status != 200:
+            self.delegate.hub_error(dev_id=self.hub_id, error=f"{api_call} Error, status code: {status}")
+            self.logger.debug(f"{self.hub_id}: _do_request resp = {content}")
+            return None
+        return _Response(status, content)
+
+    async def _request(self, api_call, params, timeout, idempotent):
+        attempts = 1 + (self.retries if idempotent else 0)
+        error = None
+        for attempt in range(attempts):
+            try:
+                async with self._session.get(self._api_prefix + api_call, params=params,
+                                             timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                    return resp.status, await resp.read(), None
+            except asyncio.TimeoutError:
+                error = f"{api_call} timeout"
+            except aiohttp.ClientError:
+                error = f"{api_call} request failure"
+            self.logger.debug(f"{self.hub_id}: _do_request {error}, attempt {attempt + 1} of {attempts}")
+        return None, None, error
+
+    def connection_stats(self):
+        return {'connections': self._connections, 'requests': self._requests}
+
+    def snapshot_camera_to_file(self, cam_id, save_path, width=0, height=0):
+        """ Stream the snapshot straight to save_path, see Camect.snapshot_camera_to_file.
+        """
+        params = {"CamId": cam_id, "Width": str(width), "Height": str(height)}
+        try:
+            return self.transport.run(self._snapshot_to_file(params, save_path), self.timeout * 2)
+        except Exception as err:
+            self.delegate.hub_error(dev_id=self.hub_id, error=f"SnapshotCamera stream error: {err}")
+            return None
+
+    async def _snapshot_to_file(self, params, save_path):
+        temp_path = None
+        try:
+            async with self._session.get(self._api_prefix + "SnapshotCamera", params=params,
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as resp:
+                if resp.status != 200:
+                    raise ValueError(f"status code: {resp.status}")
+                fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(save_path), suffix=".tmp")
+                with os.fdopen(fd, 'wb') as f:
+                    decoder = JsonBase64Decoder(f)
+                    async for chunk in resp.content.iter_chunked(SNAPSHOT_CHUNK_SIZE):
+                        decoder.feed(chunk)
+                    decoder.close()
+            os.replace(temp_path, save_path)
+        except BaseException:
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return decoder.bytes_written
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_WINDOW = 5.0        # seconds an identical alert is treated as a duplicate
+DEFAULT_MAX_SIZE = 1024     # max number of remembered events
+
+
+########################################
+class EventDedup:
+    ########################################
+    """ Bounded TTL cache of recent alert events, keyed by (hub, cam_id, desc, detected objects).
+
+    The window can be set per hub, and overridden per camera.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.hits = {}      # hub_id -> count
+        self.misses = {}
+        self._entries = OrderedDict()       # key -> expiry time, oldest first
+        self._hub_windows = {}
+        self._camera_windows = {}
+        self._lock = threading.Lock()
+
+    def set_window(self, hub_id, window, camera_windows=None):
+        with self._lock:
+            self._hub_windows[hub_id] = window
+            self._camera_windows[hub_id] = camera_windows or {}
+
+    def forget_hub(self, hub_id):
+        with self._lock:
+            self._hub_windows.pop(hub_id, None)
+            self._camera_windows.pop(hub_id, None)
+            self.hits.pop(hub_id, None)
+            self.misses.pop(hub_id, None)
+            for key in [key for key in self._entries if key[0] == hub_id]:
+                del self._entries[key]
+
+    def window(self, hub_id, cam_id):
+        window = self._camera_windows.get(hub_id, {}).get(cam_id)
+        if window is None:
+            window = self._hub_windows.get(hub_id, DEFAULT_WINDOW)
+        return window
+
+    def is_duplicate(self, hub_id, event):
+        """ Returns True if an identical event was seen inside the window, otherwise remembers this one.
+        """
+        now = time.monotonic()
+        key = (hub_id, event.get('cam_id'), event.get('desc'), tuple(event.get('detected_obj', ())))
+        with self._lock:
+            self._expire(now)
+            expiry = self._entries.get(key)
+            if expiry is not None and expiry > now:
+                self.hits[hub_id] = self.hits.get(hub_id, 0) + 1
+                return True
+
+            self.misses[hub_id] = self.misses.get(hub_id, 0) + 1
+            window = self.window(hub_id, key[1])
+            if window > 0:
+                self._entries.pop(key, None)
+                self._entries[key] = now + window
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            return False
+
+    def stats(self, hub_id):
+        with self._lock:
+            return {'hits': self.hits.get(hub_id, 0), 'misses': self.misses.get(hub_id, 0), 'size': len(self._entries)}
+
+    def _expire(self, now):
+        # entries are kept in insertion order; windows can differ per camera, so stop at the first live entry
+        # and let any shorter-lived entries behind it age out on a later pass or via max_size
+        while self._entries:
+            key, expiry = next(iter(self._entries.items()))
+            if expiry > now:
+                break
+            del self._entries[key]
+
+
+def parse_camera_windows(text):
+    """ Parse "cam_id=seconds, cam_id=seconds" into a dict.  Invalid entries are ignored.
+    """
+    windows = {}
+    for item in (text or "").split(","):
+        cam_id, _, seconds = item.partition("=")
+        try:
+            windows[cam_id.strip()] = float(seconds)
+        except ValueError:
+            continue
+    return windows
@@ -0,0 +1,198 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import LatencyHistogram
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_SIZES = "thumb:320:70, dashboard:1280:80, full:0:85"
+DEFAULT_WORKERS = 2
+
+STAGES = ("decode", "resize", "encode", "total")
+
+
+def parse_sizes(text):
+    """ Parse "label:width:quality, ..." into [(label, width, quality)].  Width 0 keeps the original size.
+    """
+    sizes = []
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        parts = [part.strip() for part in item.split(":")]
+        if len(parts) != 3 or not parts[0].replace("-", "").replace("_", "").isalnum():
+            raise ValueError(f"'{item.strip()}' is not label:width:quality")
+        label, width, quality = parts[0], int(parts[1]), int(parts[2])
+        if width < 0 or not 1 <= quality <= 95:
+            raise ValueError(f"'{item.strip()}': width must be 0 or more and quality 1 to 95")
+        sizes.append((label, width, quality))
+    return sizes
+
+
+def derivative_path(source, label):
+    base, ext = os.path.splitext(source)
+    return f"{base}-{label}{ext or '.jpg'}"
+
+
+def render(source, outputs):
+    """ Decode source once and write each (path, width, quality) output as a JPEG.  Runs in a pool process.
+
+    Outputs are made largest first, each resized from the one before it.  When no output keeps the original
+    size, JPEG decoding is scaled down to the largest output by the decoder.  Returns stage times in ms.
+    """
+    timings = {'decode': 0.0, 'resize': 0.0, 'encode': 0.0}
+    start = time.perf_counter()
+    with Image.open(source) as image:
+        widths = [width for _, width, _ in outputs]
+        if image.format == "JPEG" and widths and 0 not in widths:
+            largest = max(widths)
+            image.draft("RGB", (largest, largest * image.height // image.width))
+        image.load()
+        current = image if image.mode == "RGB" else image.convert("RGB")
+    timings['decode'] = (time.perf_counter() - start) * 1000.0
+
+    for path, width, quality in sorted(outputs, key=lambda output: output[1] or sys.maxsize, reverse=True):
+        start = time.perf_counter()
+        if width and width < current.width:
+            current = current.resize((width, max(1, round(current.height * width / current.width))), Image.LANCZOS)
+        timings['resize'] += (time.perf_counter() - start) * 1000.0
+
+        # write to a temp file and rename, so readers never see a partial image
+        start = time.perf_counter()
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                current.save(f, "JPEG", quality=quality)
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+        timings['encode'] += (time.perf_counter() - start) * 1000.0
+    return timings
+
+
+########################################
+class SnapshotProcessor:
+    ########################################
+    """ Makes resized copies of saved snapshots next to the original, in a pool of worker processes so JPEG
+    decoding and resizing don't hold the plugin's GIL.
+
+    If the pool processes can't be started in the plugin host, the work falls back to a thread pool.
+    Stage times (decode, resize, encode, and total including queueing) are kept in latency histograms.
+    """
+
+    def __init__(self, sizes, workers=DEFAULT_WORKERS):
+        self.logger = logging.getLogger("Plugin.SnapshotProcessor")
+        self.sizes = sizes
+        self.workers = max(1, workers)
+        self.completed = 0
+        self.failed = 0
+        self.timings = {stage: LatencyHistogram() for stage in STAGES}
+        self._executor = None
+        self._threaded = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return Image is not None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                if self._threaded:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="Derivatives")
+                else:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_spawn_context())
+            return self._executor
+
+    def submit(self, source):
+        if not self.sizes:
+            return
+        outputs = [(derivative_path(source, label), width, quality) for label, width, quality in self.sizes]
+        self._submit(source, outputs, time.perf_counter())
+
+    def _submit(self, source, outputs, submitted, retry=True):
+        try:
+            future = self._pool().submit(render, source, outputs)
+        except (BrokenProcessPool, RuntimeError) as err:
+            if not retry:
+                raise
+            self._fallback(err)
+            future = self._pool().submit(render, source, outputs)
+            retry = False
+        future.add_done_callback(lambda done: self._finished(done, source, outputs, submitted, retry))
+
+    def _fallback(self, err):
+        with self._lock:
+            if self._threaded:
+                return
+            self.logger.warning(f"Snapshot worker processes unavailable ({err}), using threads")
+            self._threaded = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _finished(self, future, source, outputs, submitted, retry):
+        try:
+            timings = future.result()
+        except BrokenProcessPool as err:
+            # every job queued on a broken pool lands here, run each once more on the thread pool
+            if retry:
+                self._fallback(err)
+                self._submit(source, outputs, submitted, retry=False)
+                return
+            self.failed += 1
+            self.logger.warning(f"Derivatives of {source} failed: {err}")
+            return
+        except Exception as err:
+            self.failed += 1
+            self.logger.warning(f"Derivatives of {source} failed: {err}")
+            return
+
+        timings['total'] = (time.perf_counter() - submitted) * 1000.0
+        with self._lock:
+            self.completed += 1
+            for stage in STAGES:
+                self.timings[stage].record(timings[stage])
+        self.logger.debug(f"{len(outputs)} derivatives of {os.path.basename(source)}: decode {timings['decode']:.1f} ms, "
+                          f"resize {timings['resize']:.1f} ms, encode {timings['encode']:.1f} ms, "
+                          f"total {timings['total']:.1f} ms")
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            stats = {'completed': self.completed, 'failed': self.failed,
+                     'mode': "threads" if self._threaded else "processes"}
+            for stage in STAGES:
+                stats[f"{stage}_p50_ms"] = self.timings[stage].percentile(50)
+                stats[f"{stage}_p95_ms"] = self.timings[stage].percentile(95)
+        return stats
+
+
+def _spawn_context():
+    # fork isn't safe with the plugin's threads.  The plugin host isn't a python executable, so spawned
+    # workers need the interpreter from the same Python install.
+    context = multiprocessing.get_context("spawn")
+    if not os.path.basename(sys.executable).startswith("python"):
+        python = os.path.join(sys.exec_prefix, "bin", f"python{sys.version_info[0]}.{sys.version_info[1]}")
+        if os.path.exists(python):
+            context.set_executable(python)
+    return context
@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    from zeroconf import Zeroconf, ServiceBrowser, ServiceStateChange, IPVersion
+except ImportError:
+    Zeroconf = None
+
+SERVICE_TYPE = "_camect._tcp.local."
+RESOLVE_TIMEOUT = 3000      # milliseconds to wait for a service's address records
+
+
+########################################
+class HubDiscovery:
+    ########################################
+    """ Background mDNS browser for Camect hubs on the LAN.
+
+    Keeps a hub id -> address map, saved to cache_path so hubs can be resolved at startup before the
+    browser has heard from them.  on_change(hub_id, address, port) is called from the zeroconf thread
+    when a hub seen before (in this run or the cache) shows up at a new address.  The hub id is the "id" TXT property if the
+    hub sends one, otherwise the service instance name.
+    """
+
+    def __init__(self, cache_path, on_change=None):
+        self.logger = logging.getLogger("Plugin.HubDiscovery")
+        self.cache_path = cache_path
+        self.on_change = on_change
+        self.hubs = {}          # hub_id -> {'id', 'name', 'address', 'port', 'seen', 'online'}
+        self._lock = threading.Lock()
+        self._zeroconf = None
+        self._browser = None
+        self._load()
+
+    @staticmethod
+    def available():
+        return Zeroconf is not None
+
+    def start(self):
+        if Zeroconf is None or self._zeroconf:
+            return
+        self._zeroconf = Zeroconf(ip_version=IPVersion.V4Only)
+        self._browser = ServiceBrowser(self._zeroconf, SERVICE_TYPE, handlers=[self._on_service_state_change])
+
+    def stop(self):
+        if self._browser:
+            self._browser.cancel()
+            self._browser = None
+        if self._zeroconf:
+            self._zeroconf.close()
+            self._zeroconf = None
+
+    def resolve(self, hub_id):
+        """ Returns (address, port) last seen for the hub, or None.
+        """
+        with self._lock:
+            hub = self.hubs.get(hub_id)
+            return (hub['address'], hub['port']) if hub else None
+
+    def discovered(self):
+        with self._lock:
+            return sorted((dict(hub) for hub in self.hubs.values()), key=lambda hub: hub['name'])
+
+    def _on_service_state_change(self, zeroconf, service_type, name, state_change):
+        instance = name[:-len(service_type) - 1] if name.endswith("." + service_type) else name
+        if state_change is ServiceStateChange.Removed:
+            with self._lock:
+                for hub in self.hubs.values():
+                    if hub['name'] == instance:
+                        hub['online'] = False
+            return
+
+        info = zeroconf.get_service_info(service_type, name, timeout=RESOLVE_TIMEOUT)
+        if info is None:
+            self.logger.debug(f"No service info for {name}")
+            return
+        addresses = info.parsed_addresses(IPVersion.V4Only)
+        if not addresses:
+            return
+        properties = {key.decode(errors='replace'): (value or b"").decode(errors='replace')
+                      for key, value in info.properties.items()}
+        hub_id = properties.get('id') or instance
+        address, port = addresses[0], info.port
+
+        with self._lock:
+            old = self.hubs.get(hub_id)
+            changed = old is not None and old['address'] != address
+            self.hubs[hub_id] = {'id': hub_id, 'name': instance, 'address': address, 'port': port,
+                                 'seen': time.time(), 'online': True}
+            self._save()
+        self.logger.debug(f"Discovered hub {instance} ({hub_id}) at {address}:{port}")
+        if changed:
+            self.logger.info(f"Hub {instance} moved from {old['address']}:{old['port']} to {address}:{port}")
+        if changed and self.on_change:
+            self.on_change(hub_id, address, port)
+
+    def _load(self):
+        try:
+            with open(self.cache_path) as f:
+                hubs = json.load(f)
+            for hub in hubs.values():
+                hub['online'] = False
+            self.hubs = hubs
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError, TypeError) as err:
+            self.logger.warning(f"Ignoring unreadable discovery cache: {err}")
+
+    def _save(self):
+        try:
+            folder = os.path.dirname(self.cache_path)
+            os.makedirs(folder, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.hubs, f, sort_keys=True, indent=4)
+            os.replace(temp_path, self.cache_path)
+        except OSError as err:
+            self.logger.warning(f"Unable to write discovery cache: {err}")
@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import re
+import threading
+
+EVENT_TYPES = ("alert", "alert_enabled", "alert_disabled", "camera_offline", "camera_online", "mode")
+ALERT_STATE_EVENTS = ("alert_enabled", "alert_disabled")      # always subscribed
+
+_TYPE_RE = re.compile(r'"type"\s*:\s*"([^"]*)"')
+_CAM_ID_RE = re.compile(r'"cam_id"\s*:\s*"([^"]*)"')
+
+
+########################################
+class EventFilter:
+    ########################################
+    """ Per-hub subscription filter applied to raw websocket frames before they are queued or parsed.
+
+    The subscription maps event type to the set of camera ids wanted, or None for any camera.  Frames
+    are checked with two regex searches; anything the filter can't classify is passed through for the
+    full parser to deal with.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.passed = 0
+        self.dropped = 0
+        self._subscription = {}
+        self._lock = threading.Lock()
+
+    def update(self, subscription, enabled=True):
+        with self._lock:
+            self._subscription = subscription
+            self.enabled = enabled
+
+    def add(self, subscription):
+        """ Widen the subscription to take in another one, e.g. for a trigger that just started.
+        """
+        with self._lock:
+            # accept() reads without the lock, so build a new dict rather than changing the live one
+            merged = {event_type: None if cameras is None else set(cameras)
+                      for event_type, cameras in self._subscription.items()}
+            for event_type, cameras in subscription.items():
+                if cameras is None or (event_type in merged and merged[event_type] is None):
+                    merged[event_type] = None
+                else:
+                    merged.setdefault(event_type, set()).update(cameras)
+            self._subscription = merged
+
+    def accept(self, message):
+        if not self.enabled:
+            return True
+        subscription = self._subscription
+        match = _TYPE_RE.search(message)
+        if match:
+            event_type = match.group(1)
+            if event_type not in subscription and event_type in EVENT_TYPES:
+                self.dropped += 1
+                return False
+            cameras = subscription.get(event_type)
+            if cameras is not None:
+                match = _CAM_ID_RE.search(message)
+                if match and match.group(1) not in cameras:
+                    self.dropped += 1
+                    return False
+        self.passed += 1
+        return True
+
+    def stats(self):
+        return {'passed': self.passed, 'dropped': self.dropped}
+
+
+def build_subscription(hub_id, trigger_props, allow_list=""):
+    """ Work out which events a hub needs from the active triggers plus an allow-list.
+
+    trigger_props is a list of (pluginTypeId, pluginProps).  The allow-list is a comma separated list of
+    event types (wanted from every camera) and camera ids (every event type from that camera).
+    """
+    subscription = {}
+
+    def want(event_type, cam_id):
+        if event_type in subscription and subscription[event_type] is None:
+            return
+        if cam_id == "-1" or cam_id is None:
+            subscription[event_type] = None
+        else:
+            subscription.setdefault(event_type, set()).add(cam_id)
+
+    # the plugin's tracked alert state (alert_state.py) follows these from every camera
+    for event_type in ALERT_STATE_EVENTS:
+        want(event_type, None)
+
+    for type_id, props in trigger_props:
+        if props.get("camectID") not in ("-1", str(hub_id)):
+            continue
+        if type_id == "alertEvent":
+            want("alert", props.get("cameraID"))
+        elif type_id == "cameraEvent":
+            want(props.get("type"), props.get("cameraID"))
+        elif type_id == "modeEvent":
+            want("mode", None)
+
+    for entry in (item.strip() for item in (allow_list or "").split(",")):
+        if not entry:
+            continue
+        if entry in EVENT_TYPES:
+            want(entry, None)
+        else:
+            for event_type in EVENT_TYPES:
+                want(event_type, entry)
+
+    return subscription
@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import sys
+import threading
+import time
+
+DEFAULT_HISTORY_SIZE = 1000
+
+
+########################################
+class EventRecord:
+    ########################################
+    __slots__ = ('time', 'type', 'cam_id', 'cam_name', 'desc', 'objects')
+
+    def __init__(self, when, event_type, cam_id, cam_name, desc, objects):
+        self.time = when
+        self.type = event_type
+        self.cam_id = cam_id
+        self.cam_name = cam_name
+        self.desc = desc
+        self.objects = objects
+
+    def as_dict(self):
+        return {
+            'time': self.time,
+            'type': self.type,
+            'cam_id': self.cam_id,
+            'cam_name': self.cam_name,
+            'desc': self.desc,
+            'objects': sorted(self.objects),
+        }
+
+
+########################################
+class EventHistory:
+    ########################################
+    """ Fixed-size ring buffer of recent events for one hub.
+
+    Records are slotted objects with interned strings (camera ids, names, types and object names repeat
+    constantly), so the buffer costs a few hundred bytes per event instead of the raw JSON.
+    """
+
+    def __init__(self, size=DEFAULT_HISTORY_SIZE):
+        self.size = max(1, size)
+        self._slots = [None] * self.size
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(1 for record in self._slots if record is not None)
+
+    def add(self, event, when=None):
+        record = EventRecord(when or time.time(),
+                             _intern(event.get('type')),
+                             _intern(event.get('cam_id')),
+                             _intern(event.get('cam_name')),
+                             event.get('desc', ''),
+                             frozenset(_intern(obj) for obj in event.get('detected_obj') or ()))
+        with self._lock:
+            self._slots[self._next] = record
+            self._next = (self._next + 1) % self.size
+
+    def query(self, cam_id=None, event_type=None, obj=None, since=None, limit=None):
+        """ Matching records as dicts, newest first.  since is a time.time() value.
+        """
+        with self._lock:
+            ordered = self._slots[self._next:] + self._slots[:self._next]
+        results = []
+        for record in reversed(ordered):
+            if record is None:
+                break
+            if since is not None and record.time < since:
+                break
+            if cam_id is not None and record.cam_id != cam_id:
+                continue
+            if event_type is not None and record.type != event_type:
+                continue
+            if obj is not None and obj not in record.objects:
+                continue
+            results.append(record.as_dict())
+            if limit and len(results) >= limit:
+                break
+        return results
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
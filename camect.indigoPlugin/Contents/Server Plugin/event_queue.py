@@ -0,0 +1,127 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+DEFAULT_QUEUE_SIZE = 256
+
+DROP_OLDEST = "drop_oldest"
+COALESCE_CAMERA = "coalesce_camera"
+
+
+########################################
+class EventQueue:
+    ########################################
+    """ Bounded queue between the websocket receive thread and a dispatch worker.
+
+    When the queue is full the overflow policy decides what is lost:
+        drop_oldest     - the oldest queued event is discarded
+        coalesce_camera - a queued event of the same type for the same camera is replaced by the
+                          new one, falling back to drop_oldest if there is none
+
+    A queue can be shared by several hubs, the source passed to put() is handed back to the handler.
+    """
+
+    def __init__(self, name, handler, max_size=DEFAULT_QUEUE_SIZE, policy=DROP_OLDEST):
+        self.logger = logging.getLogger("Plugin.EventQueue")
+        self.name = name
+        self.handler = handler          # called as handler(message, received, source)
+        self.max_size = max(1, max_size)
+        self.policy = policy
+
+        self.received = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+
+        self._queue = deque()           # (received, message, coalesce key, source)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=f"EventQueue-{name}", daemon=True)
+        self._thread.start()
+
+    def put(self, message, source=None):
+        received = time.time()
+        with self._cond:
+            self.received += 1
+            if len(self._queue) >= self.max_size:
+                self._overflow(received, message, source)
+            else:
+                self._queue.append((received, message, None, source))
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+    def depth(self):
+        return len(self._queue)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'depth': len(self._queue),
+                'max_depth': self.max_depth,
+                'received': self.received,
+                'dispatched': self.dispatched,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'lag_avg': self.lag_total / self.dispatched if self.dispatched else 0.0,
+                'lag_max': self.lag_max,
+            }
+
+    def _overflow(self, received, message, source):
+        if self.policy == COALESCE_CAMERA:
+            key = _coalesce_key(message, source)
+            for i, (queued_received, queued_message, queued_key, queued_source) in enumerate(self._queue):
+                if queued_key is None:
+                    queued_key = _coalesce_key(queued_message, queued_source)
+                    self._queue[i] = (queued_received, queued_message, queued_key, queued_source)
+                if queued_key == key:
+                    # keep the original receive time so lag still measures the oldest wait
+                    self._queue[i] = (queued_received, message, key, source)
+                    self.coalesced += 1
+                    return
+        self._queue.popleft()
+        self.dropped += 1
+        self._queue.append((received, message, None, source))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                received, message, _, source = self._queue.popleft()
+
+            lag = time.time() - received
+            try:
+                self.handler(message, received, source)
+            except Exception as err:
+                self.logger.exception(f"{self.name}: event handler error: {err}")
+
+            with self._cond:
+                self.dispatched += 1
+                self.lag_total += lag
+                self.lag_max = max(self.lag_max, lag)
+
+
+def _coalesce_key(message, source):
+    try:
+        event = json.loads(message)
+        return source, event.get('type'), event.get('cam_id', '')
+    except (ValueError, AttributeError):
+        return source,
@@ -0,0 +1,257 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+DEFAULT_RETENTION = 30          # days raw events are kept
+DEFAULT_ROLLUP_RETENTION = 365  # days hourly and daily counts are kept
+BATCH_SIZE = 500                # max events per write transaction
+FLUSH_INTERVAL = 2.0            # seconds between writes when events are trickling in
+MAX_PENDING = 10000             # events waiting for the writer before new ones are dropped
+PRUNE_INTERVAL = 3600.0         # seconds between retention passes
+
+PERIODS = {"hour": "rollup_hourly", "day": "rollup_daily"}
+GROUPS = ("cam_id", "type", "object")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    hub INTEGER NOT NULL,
+    cam_id TEXT NOT NULL,
+    cam_name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    objects TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_hub_time ON events (hub, time);
+CREATE INDEX IF NOT EXISTS events_hub_cam_time ON events (hub, cam_id, time);
+CREATE INDEX IF NOT EXISTS events_hub_type_time ON events (hub, type, time);
+CREATE TABLE IF NOT EXISTS rollup_hourly (
+    hub INTEGER NOT NULL, bucket INTEGER NOT NULL, cam_id TEXT NOT NULL, type TEXT NOT NULL, object TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (hub, bucket, cam_id, type, object)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    hub INTEGER NOT NULL, bucket INTEGER NOT NULL, cam_id TEXT NOT NULL, type TEXT NOT NULL, object TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (hub, bucket, cam_id, type, object)
+) WITHOUT ROWID;
+"""
+
+
+########################################
+class EventStore:
+    ########################################
+    """ Append-only SQLite store of hub events, with hourly and daily counts per camera and type, and per
+    detected object.
+
+    add() only puts the event on an in-memory queue, it never touches the disk.  A writer thread owns the
+    database connection and writes queued events in batches, one transaction per batch, updating the
+    rollup tables from the batch as it goes.  Buckets start at local hour and day boundaries.  Queries
+    open their own connection, so they don't wait for the writer.
+    """
+
+    def __init__(self, path, retention=DEFAULT_RETENTION, rollup_retention=DEFAULT_ROLLUP_RETENTION,
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.logger = logging.getLogger("Plugin.EventStore")
+        self.path = path
+        self.retention = retention
+        self.rollup_retention = rollup_retention
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.pruned = 0
+        self.last_batch_ms = 0.0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="EventStore", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10.0)
+
+    def add(self, hub_id, event, when=None):
+        try:
+            self._queue.put_nowait((when or time.time(), hub_id, event))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=10.0):
+        """ Write what's queued and stop the writer.
+        """
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {'pending': self._queue.qsize(), 'written': self.written, 'dropped': self.dropped,
+                'batches': self.batches, 'pruned': self.pruned, 'last_batch_ms': round(self.last_batch_ms, 1)}
+
+    ################################################################################
+    # Writer thread
+    ################################################################################
+
+    def _run(self):
+        db = self._connect()
+        db.execute("PRAGMA synchronous=NORMAL")
+        next_prune = time.monotonic()
+        try:
+            while True:
+                batch = self._take_batch()
+                if batch:
+                    try:
+                        self._write(db, batch)
+                    except sqlite3.Error as err:
+                        self.dropped += len(batch)
+                        self.logger.warning(f"Unable to write {len(batch)} events: {err}")
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + PRUNE_INTERVAL
+                    try:
+                        self._prune(db)
+                    except sqlite3.Error as err:
+                        self.logger.warning(f"Unable to prune event store: {err}")
+                if self._stopped.is_set() and self._queue.empty():
+                    return
+        finally:
+            db.close()
+
+    def _take_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            wait = deadline - time.monotonic()
+            if self._stopped.is_set():
+                wait = 0
+            try:
+                batch.append(self._queue.get(timeout=wait) if wait > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, db, batch):
+        start = time.perf_counter()
+        rows = []
+        hourly = Counter()
+        daily = Counter()
+        buckets = {}
+        for when, hub_id, event in batch:
+            cam_id = event.get('cam_id') or ""
+            # one row per event (object ""), plus one per detected object
+            objects = [""] + [obj for obj in event.get('detected_obj') or () if obj]
+            rows.append((when, hub_id, cam_id, event.get('cam_name') or "", event.get('type', ""),
+                         " ".join(event.get('detected_obj') or ()), event.get('desc') or ""))
+
+            hour = int(when // 3600)
+            if hour not in buckets:
+                buckets[hour] = _buckets(when)
+            hour_start, day_start = buckets[hour]
+            for obj in objects:
+                hourly[(hub_id, hour_start, cam_id, event.get('type', ""), obj)] += 1
+                daily[(hub_id, day_start, cam_id, event.get('type', ""), obj)] += 1
+
+        upsert = "INSERT INTO {} (hub, bucket, cam_id, type, object, count) VALUES (?, ?, ?, ?, ?, ?) " \
+                 "ON CONFLICT (hub, bucket, cam_id, type, object) DO UPDATE SET count = count + excluded.count"
+        with db:
+            db.executemany("INSERT INTO events (time, hub, cam_id, cam_name, type, objects, description) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            db.executemany(upsert.format("rollup_hourly"), [key + (count,) for key, count in hourly.items()])
+            db.executemany(upsert.format("rollup_daily"), [key + (count,) for key, count in daily.items()])
+
+        self.written += len(batch)
+        self.batches += 1
+        self.last_batch_ms = (time.perf_counter() - start) * 1000.0
+
+    def _prune(self, db):
+        now = time.time()
+        with db:
+            pruned = db.execute("DELETE FROM events WHERE time < ?", (now - self.retention * 86400,)).rowcount
+            for table in PERIODS.values():
+                db.execute(f"DELETE FROM {table} WHERE bucket < ?", (now - self.rollup_retention * 86400,))
+        self.pruned += pruned
+        if pruned:
+            self.logger.debug(f"Pruned {pruned} events older than {self.retention} days")
+
+    ################################################################################
+    # Queries
+    ################################################################################
+
+    def counts(self, hub_id=None, period="day", since=None, until=None, group_by=("cam_id",), cam_id=None,
+               event_type=None, obj=None):
+        """ Event counts from the rollup tables, one dict per bucket and group, oldest first.
+
+        Counts are of events, unless grouped or filtered by object.  Then they are of events that saw each
+        object, and an alert that saw several objects is counted under each of them.
+        """
+        table = PERIODS[period]
+        group_by = [column for column in group_by if column in GROUPS]
+        where, params = _where(hub=hub_id, cam_id=cam_id, type=event_type, object=obj)
+        if obj is None:
+            where.append("object != ''" if "object" in group_by else "object = ''")
+        if since is not None:
+            where.append("bucket >= ?")
+            params.append(_buckets(since)[0 if period == "hour" else 1])
+        if until is not None:
+            where.append("bucket < ?")
+            params.append(until)
+        columns = ", ".join(["hub", "bucket"] + group_by)
+        sql = f"SELECT {columns}, SUM(count) FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" GROUP BY {columns} ORDER BY bucket, {columns}"
+        with self._connect() as db:
+            names = ["hub", "bucket"] + group_by + ["count"]
+            return [dict(zip(names, row)) for row in db.execute(sql, params)]
+
+    def events(self, hub_id=None, cam_id=None, event_type=None, since=None, until=None, limit=100):
+        """ Raw events, newest first, in the same form as EventHistory.query().
+        """
+        where, params = _where(hub=hub_id, cam_id=cam_id, type=event_type)
+        if since is not None:
+            where.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("time < ?")
+            params.append(until)
+        sql = "SELECT time, hub, cam_id, cam_name, type, objects, description FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY time DESC LIMIT ?"
+        params.append(int(limit))
+        with self._connect() as db:
+            rows = db.execute(sql, params).fetchall()
+        return [{'time': row[0], 'hub': row[1], 'cam_id': row[2], 'cam_name': row[3], 'type': row[4],
+                 'objects': row[5].split(), 'desc': row[6]} for row in rows]
+
+
+def _buckets(when):
+    """ Start of the local hour and local day holding when, as timestamps.
+    """
+    local = datetime.fromtimestamp(when)
+    hour = local.replace(minute=0, second=0, microsecond=0)
+    return int(hour.timestamp()), int(hour.replace(hour=0).timestamp())
+
+
+def _where(**filters):
+    where, params = [], []
+    for column, value in filters.items():
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    return where, params
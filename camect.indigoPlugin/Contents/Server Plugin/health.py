@@ -0,0 +1,128 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import logging
+import threading
+import time
+from collections import deque
+
+DEFAULT_PING_INTERVAL = 5.0     # seconds between websocket pings
+DEFAULT_PONG_TIMEOUT = 12.0     # seconds without a pong before the link is stale
+DEFAULT_WINDOW = 100            # samples kept for the rolling averages
+CHECK_INTERVAL = 1.0            # seconds between stale checks
+
+
+########################################
+class LinkHealth:
+    ########################################
+    """ Websocket link quality for one hub: ping round trip times, time between received frames, and
+    how long it has been since the last pong.  Times are from time.monotonic().
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.rtt = deque(maxlen=window)             # seconds
+        self.intervals = deque(maxlen=window)       # seconds between frames
+        self.last_pong = None                       # None while not connected
+        self.last_frame = None
+        self.stale_count = 0
+        self.stale_since = None                     # last pong before the link was declared stale
+        self.last_failover = None                   # seconds from last pong to reconnected, after a stale link
+        self._lock = threading.Lock()
+
+    def connected(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.last_pong = now
+            self.last_frame = None
+            if self.stale_since is not None:
+                self.last_failover = now - self.stale_since
+                self.stale_since = None
+
+    def disconnected(self):
+        with self._lock:
+            self.last_pong = None
+
+    def pong(self, rtt, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.last_pong is not None:
+                self.last_pong = now
+            if rtt >= 0:
+                self.rtt.append(rtt)
+
+    def frame(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.last_frame is not None:
+                self.intervals.append(now - self.last_frame)
+            self.last_frame = now
+
+    def check(self, timeout, now=None):
+        """ Returns True, once, when the link has gone more than timeout seconds without a pong.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.last_pong is None or now - self.last_pong <= timeout:
+                return False
+            self.stale_count += 1
+            self.stale_since = self.last_pong
+            self.last_pong = None
+            return True
+
+    def stats(self):
+        with self._lock:
+            rtt, intervals = sorted(self.rtt), sorted(self.intervals)
+        return {'rtt_avg_ms': round(_mean(rtt) * 1000.0, 1),
+                'rtt_p95_ms': round(_p95(rtt) * 1000.0, 1),
+                'interval_avg_s': round(_mean(intervals), 2),
+                'interval_p95_s': round(_p95(intervals), 2),
+                'stale_count': self.stale_count,
+                'last_failover_s': round(self.last_failover, 2) if self.last_failover is not None else 0.0}
+
+
+########################################
+class HealthMonitor:
+    ########################################
+    """ One thread that checks every hub's LinkHealth and forces a reconnect when a link goes stale, so
+    failover time is bounded by the pong timeout rather than TCP timeouts.
+
+    clients is a callable returning {dev_id: client}, each client having health, ping_interval, pong_timeout
+    and reconnect().  A ping interval or pong timeout of 0 turns the check off for that hub.  A link is given
+    at least two ping intervals, so a pong timeout shorter than that doesn't drop healthy links.
+    """
+
+    def __init__(self, clients, interval=CHECK_INTERVAL):
+        self.logger = logging.getLogger("Plugin.HealthMonitor")
+        self.clients = clients
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="HealthMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            for dev_id, client in list(self.clients().items()):
+                try:
+                    if client.ping_interval <= 0 or client.pong_timeout <= 0:
+                        continue
+                    timeout = max(client.pong_timeout, 2 * client.ping_interval)
+                    if client.health.check(timeout, now):
+                        self.logger.warning(f"{dev_id}: no websocket pong for {timeout:.0f} seconds, reconnecting")
+                        client.reconnect()
+                except Exception as err:
+                    self.logger.debug(f"{dev_id}: health check error: {err}")
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def _p95(values):
+    # values are sorted
+    return values[min(len(values) - 1, int(len(values) * 0.95))] if values else 0.0
@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import LatencyHistogram
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024    # total size of cached images
+DEFAULT_TTL = 30.0                      # seconds a prefetched image is served
+
+
+########################################
+class ImageCache:
+    ########################################
+    """ Size-bounded TTL cache of camera snapshots, filled by prefetching on alerts.
+
+    Images are keyed by (hub, cam_id).  While a prefetch is running a get() for the same camera waits for
+    it instead of making a second request.  Hits, misses and prefetch latency are counted per hub.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries = OrderedDict()       # key -> (expiry, image), oldest first
+        self._pending = {}                  # key -> (start, Event) for prefetches in progress
+        self._stats = {}                    # hub_id -> counters and prefetch latency histogram
+        self._lock = threading.Lock()
+
+    def configure(self, max_bytes, ttl):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.ttl = ttl
+            self._evict(time.monotonic())
+
+    def _hub_stats(self, hub_id):
+        stats = self._stats.get(hub_id)
+        if stats is None:
+            stats = self._stats[hub_id] = {'hits': 0, 'misses': 0, 'prefetches': 0, 'failed': 0,
+                                           'latency': LatencyHistogram()}
+        return stats
+
+    def start_prefetch(self, hub_id, cam_id):
+        """ Returns False if a prefetch for the camera is already running.  A cached image is always replaced,
+        since it was taken for an earlier alert.
+        """
+        key = (hub_id, cam_id)
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending[key] = (time.perf_counter(), threading.Event())
+            return True
+
+    def finish_prefetch(self, hub_id, cam_id, image):
+        """ Store the result of a prefetch, image is None if it failed.
+        """
+        key = (hub_id, cam_id)
+        with self._lock:
+            start, done = self._pending.pop(key, (None, None))
+            stats = self._hub_stats(hub_id)
+            if image:
+                stats['prefetches'] += 1
+                if start is not None:
+                    stats['latency'].record((time.perf_counter() - start) * 1000.0)
+                self._store(key, image)
+            else:
+                stats['failed'] += 1
+        if done is not None:
+            done.set()
+
+    def get(self, hub_id, cam_id, wait=0.0):
+        """ Cached image for the camera, or None.  Waits up to wait seconds for a prefetch in progress.
+        """
+        key = (hub_id, cam_id)
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None and wait > 0:
+            pending[1].wait(wait)
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            stats = self._hub_stats(hub_id)
+            if entry is None:
+                stats['misses'] += 1
+                return None
+            stats['hits'] += 1
+            return entry[1]
+
+    def forget_hub(self, hub_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == hub_id]:
+                self.size -= len(self._entries.pop(key)[1])
+            self._stats.pop(hub_id, None)
+
+    def stats(self, hub_id):
+        with self._lock:
+            stats = self._hub_stats(hub_id)
+            lookups = stats['hits'] + stats['misses']
+            return {'hits': stats['hits'], 'misses': stats['misses'],
+                    'hit_rate': round(100.0 * stats['hits'] / lookups, 1) if lookups else 0.0,
+                    'prefetches': stats['prefetches'], 'failed': stats['failed'],
+                    'prefetch_p50_ms': stats['latency'].percentile(50),
+                    'prefetch_p95_ms': stats['latency'].percentile(95),
+                    'entries': len(self._entries), 'bytes': self.size}
+
+    def _store(self, key, image):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old[1])
+        if len(image) > self.max_bytes:
+            return
+        now = time.monotonic()
+        self._entries[key] = (now + self.ttl, image)
+        self.size += len(image)
+        self._evict(now)
+
+    def _expire(self, now):
+        # entries are added with the same ttl, so the oldest expire first
+        while self._entries:
+            key, (expiry, image) = next(iter(self._entries.items()))
+            if expiry > now:
+                break
+            del self._entries[key]
+            self.size -= len(image)
+
+    def _evict(self, now):
+        self._expire(now)
+        while self.size > self.max_bytes and self._entries:
+            _, (_, image) = self._entries.popitem(last=False)
+            self.size -= len(image)
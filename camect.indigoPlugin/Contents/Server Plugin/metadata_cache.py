@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import json
+import logging
+import os
+import tempfile
+
+
+########################################
+class MetadataCache:
+    ########################################
+    """ On-disk cache of each hub's GetHomeInfo and ListCameras results, one JSON file per hub device.
+    """
+
+    def __init__(self, folder):
+        self.logger = logging.getLogger("Plugin.MetadataCache")
+        self.folder = folder
+
+    def _path(self, hub_id):
+        return os.path.join(self.folder, f"hub-{hub_id}.json")
+
+    def load(self, hub_id):
+        """ Returns (info, cameras) or (None, None) if there's no usable cache for the hub.
+        """
+        try:
+            with open(self._path(hub_id)) as f:
+                data = json.load(f)
+            return data['info'], data['cameras']
+        except FileNotFoundError:
+            return None, None
+        except (OSError, ValueError, KeyError) as err:
+            self.logger.warning(f"Ignoring unreadable metadata cache for {hub_id}: {err}")
+            return None, None
+
+    def save(self, hub_id, info, cameras):
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'info': info, 'cameras': cameras}, f, sort_keys=True, indent=4)
+            os.replace(temp_path, self._path(hub_id))
+        except OSError as err:
+            self.logger.warning(f"Unable to write metadata cache for {hub_id}: {err}")
+
+    def remove(self, hub_id):
+        try:
+            os.unlink(self._path(hub_id))
+        except OSError:
+            pass
+
+
+def diff_cameras(old, new):
+    """ Compare two {cam_id: camera} dicts, returns (added, removed, changed) lists of camera ids.
+    """
+    added = [cam_id for cam_id in new if cam_id not in old]
+    removed = [cam_id for cam_id in old if cam_id not in new]
+    changed = [cam_id for cam_id in new if cam_id in old and new[cam_id] != old[cam_id]]
+    return added, removed, changed
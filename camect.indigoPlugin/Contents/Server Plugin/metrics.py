@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import bisect
+import threading
+import time
+
+# histogram bucket upper bounds, in milliseconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0, 10000.0)
+
+STAGES = ("receive", "parse", "dedup", "state", "match", "execute")
+
+
+########################################
+class LatencyHistogram:
+    ########################################
+    """ Fixed-bucket latency histogram.  Recording is a bisect and two adds, so it can stay on in production.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, pct):
+        """ Upper bound of the bucket holding the given percentile, capped at the largest recorded value.
+        """
+        if not self.count:
+            return 0.0
+        target = self.count * pct / 100.0
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+########################################
+class HubMetrics:
+    ########################################
+    """ Per-hub event counters and a latency histogram for each stage of the event pipeline.
+    """
+
+    def __init__(self):
+        self.events = {}
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.pipeline = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def count(self, event_type):
+        with self._lock:
+            self.events[event_type] = self.events.get(event_type, 0) + 1
+
+    def record(self, stage, ms):
+        with self._lock:
+            self.stages[stage].record(ms)
+
+    def record_pipeline(self, since):
+        """ Record the end to end time for an event, since is the mark taken when processing started.
+        """
+        ms = (time.perf_counter() - since) * 1000.0
+        with self._lock:
+            self.pipeline.record(ms)
+
+    def record_receive(self, received):
+        """ received is the wall clock time the frame was read from the websocket.
+        """
+        self.record("receive", (time.time() - received) * 1000.0)
+
+    @staticmethod
+    def mark():
+        return time.perf_counter()
+
+    def lap(self, stage, since):
+        """ Record the time since the last mark for the stage, and return a new mark.
+        """
+        now = time.perf_counter()
+        self.record(stage, (now - since) * 1000.0)
+        return now
+
+    def total_events(self):
+        return sum(self.events.values())
+
+    def slowest_stage(self):
+        stages = [(hist.mean(), stage) for stage, hist in self.stages.items() if hist.count]
+        return max(stages)[1] if stages else ""
+
+    def summary(self):
+        with self._lock:
+            lines = [f"Events: {self.total_events()} {self.events}"]
+            for stage, hist in list(self.stages.items()) + [("total", self.pipeline)]:
+                lines.append(f"{stage:>10}: count {hist.count:8d}, mean {hist.mean():9.3f} ms, "
+                             f"p50 {hist.percentile(50):9.3f} ms, p95 {hist.percentile(95):9.3f} ms, "
+                             f"p99 {hist.percentile(99):9.3f} ms, max {hist.max:9.3f} ms")
+            return "\n".join(lines)
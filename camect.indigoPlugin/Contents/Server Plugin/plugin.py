@@ -5,14 +5,39 @@
 import indigo
 import logging
 import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, date, time
 from camect import Camect
+try:
+    from camect_async import AsyncCamect, AsyncTransport
+except ImportError:
+    AsyncCamect = AsyncTransport = None
+from triggers import TriggerIndex, AlertPredicate, parse_time
+from dedup import EventDedup, parse_camera_windows
+from metrics import HubMetrics
+from metadata_cache import MetadataCache, diff_cameras
+from event_history import EventHistory, DEFAULT_HISTORY_SIZE
+from state_writer import StateWriter
+from event_filter import EventFilter, build_subscription
+from alert_state import AlertState
+from discovery import HubDiscovery
+from image_cache import ImageCache, DEFAULT_MAX_BYTES, DEFAULT_TTL
+from action_queue import ActionQueue
+from health import HealthMonitor
+from event_store import EventStore, DEFAULT_RETENTION, DEFAULT_ROLLUP_RETENTION
+from derivatives import SnapshotProcessor, parse_sizes, DEFAULT_SIZES, DEFAULT_WORKERS
 import requests
 
 requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
 
 TS_FORMAT = "%Y-%m-%d %H:%M:%S"
 RESTART_TIME = 60.0         # seconds to wait when restarting the connection to a Camect
+STATS_INTERVAL = 60.0       # seconds between statistics state updates
+SNAPSHOT_WORKERS = 8        # default number of concurrent snapshot requests
+METADATA_REFRESH = 15.0     # default minutes between camera list refreshes
 
 class Plugin(indigo.PluginBase):
 
@@ -32,19 +57,184 @@ class Plugin(indigo.PluginBase):
         self.camects = {}
         self.camect_info = {}
         self.camect_cameras = {}
-        self.alert_triggers = {}
-        self.camera_triggers = {}
-        self.mode_triggers = {}
-
-        self.last_event = None
-        self.last_event_time = datetime.now()
-        self.last_event_delay = 5.0
+        self.alert_triggers = TriggerIndex(3)     # camectID, cameraID, object
+        self.camera_triggers = TriggerIndex(3)    # camectID, cameraID, type
+        self.mode_triggers = TriggerIndex(1)      # camectID
+        self.alert_predicates = {}                # triggerID -> AlertPredicate
+
+        self.dedup = EventDedup()
+        self.metrics = {}
+        self.event_history = {}
+        self.state_writers = {}
+        self.event_filters = {}
+        self.stale_filters = set()                # hubs whose event filter is rebuilt on the next pass
+        self.action_queues = {}
+        self.alert_state = AlertState()
+        self.image_cache = ImageCache()
+        self.prefetch_hubs = set()
+        self.prefetch_executor = None
+        self.async_transport = None
+        self.metadata_cache = None
+        self.discovery = None
+        self.health_monitor = None
+        self.event_store = None
+        self.snapshot_processor = None
+        self.last_metadata_refresh = datetime.now()
 
     def startup(self):
         self.logger.info("Starting Camect")
+        self.metadata_cache = MetadataCache(f"{indigo.server.getInstallFolderPath()}/Preferences/Plugins/{self.pluginId}")
+        self.configure_image_cache(self.pluginPrefs)
+        self.configure_event_store(self.pluginPrefs)
+        self.configure_snapshot_processor(self.pluginPrefs)
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS, thread_name_prefix="Prefetch")
+        self.health_monitor = HealthMonitor(lambda: self.camects)
+        if self.pluginPrefs.get("discovery", True):
+            if HubDiscovery.available():
+                self.discovery = HubDiscovery(os.path.join(self.metadata_cache.folder, "discovered.json"),
+                                              on_change=self.hub_moved)
+                self.discovery.start()
+            else:
+                self.logger.warning("Hub discovery requires the zeroconf package")
 
     def shutdown(self):
         self.logger.info("Stopping Camect")
+        if self.discovery:
+            self.discovery.stop()
+        if self.health_monitor:
+            self.health_monitor.stop()
+        if self.async_transport:
+            self.async_transport.close()
+        if self.prefetch_executor:
+            self.prefetch_executor.shutdown(wait=False)
+        if self.event_store:
+            self.event_store.close()
+        if self.snapshot_processor:
+            self.snapshot_processor.stop()
+
+    def configure_image_cache(self, prefs):
+        try:
+            max_bytes = int(float(prefs.get("snapshotCacheSize", DEFAULT_MAX_BYTES / 1048576)) * 1048576)
+            ttl = float(prefs.get("snapshotCacheTTL", DEFAULT_TTL))
+        except ValueError:
+            max_bytes, ttl = DEFAULT_MAX_BYTES, DEFAULT_TTL
+        self.image_cache.configure(max_bytes, ttl)
+
+    def configure_event_store(self, prefs):
+        if not prefs.get("eventStore", False):
+            if self.event_store:
+                self.event_store.close()
+                self.event_store = None
+            return
+        try:
+            retention = float(prefs.get("eventRetention", DEFAULT_RETENTION))
+            rollup_retention = float(prefs.get("rollupRetention", DEFAULT_ROLLUP_RETENTION))
+        except ValueError:
+            retention, rollup_retention = DEFAULT_RETENTION, DEFAULT_ROLLUP_RETENTION
+        if self.event_store:
+            self.event_store.retention = retention
+            self.event_store.rollup_retention = rollup_retention
+            return
+        try:
+            self.event_store = EventStore(os.path.join(self.metadata_cache.folder, "events.sqlite"),
+                                          retention=retention, rollup_retention=rollup_retention)
+        except Exception as err:
+            self.logger.warning(f"Unable to open event store: {err}")
+
+    def configure_snapshot_processor(self, prefs):
+        if not prefs.get("snapshotDerivatives", False):
+            if self.snapshot_processor:
+                self.snapshot_processor.stop()
+                self.snapshot_processor = None
+            return
+        if not SnapshotProcessor.available():
+            self.logger.warning("Snapshot sizes require the Pillow package")
+            return
+        try:
+            sizes = parse_sizes(prefs.get("snapshotSizes", DEFAULT_SIZES))
+            workers = int(prefs.get("snapshotProcesses", DEFAULT_WORKERS))
+        except ValueError as err:
+            self.logger.warning(f"Invalid snapshot sizes, using defaults: {err}")
+            sizes, workers = parse_sizes(DEFAULT_SIZES), DEFAULT_WORKERS
+        if self.snapshot_processor and self.snapshot_processor.workers == max(1, workers):
+            self.snapshot_processor.sizes = sizes
+            return
+        if self.snapshot_processor:
+            self.snapshot_processor.stop()
+        self.snapshot_processor = SnapshotProcessor(sizes, workers)
+
+    def runConcurrentThread(self):
+        try:
+            while True:
+                self.sleep(STATS_INTERVAL)
+                while self.stale_filters:
+                    self.update_event_filter(self.stale_filters.pop())
+                self.update_stats()
+
+                try:
+                    refresh = float(self.pluginPrefs.get("metadataRefresh", METADATA_REFRESH)) * 60.0
+                except ValueError:
+                    refresh = METADATA_REFRESH * 60.0
+                if refresh > 0 and (datetime.now() - self.last_metadata_refresh).total_seconds() >= refresh:
+                    self.last_metadata_refresh = datetime.now()
+                    for devID in list(self.camects):
+                        self.refresh_cameras(devID)
+        except self.StopThread:
+            pass
+
+    def update_stats(self):
+        for devID, camect in list(self.camects.items()):
+            # deviceStopComm may be taking the hub down on another thread
+            writer = self.state_writers.get(devID)
+            actions = self.action_queues.get(devID)
+            event_filter = self.event_filters.get(devID)
+            if not (writer and actions and event_filter):
+                continue
+            stats = self.dedup.stats(devID)
+            conn_stats = camect.connection_stats()
+            queue_stats = camect.events.stats()
+            metrics = self.metrics.setdefault(devID, HubMetrics())
+            writer_stats = writer.stats()
+            cache_stats = self.image_cache.stats(devID)
+            action_stats = actions.stats()
+            health = camect.health.stats()
+            key_value_list = [
+                {'key': 'dedup_hits', 'value': stats['hits']},
+                {'key': 'dedup_misses', 'value': stats['misses']},
+                {'key': 'http_connections', 'value': conn_stats['connections']},
+                {'key': 'http_requests', 'value': conn_stats['requests']},
+                {'key': 'queue_depth', 'value': queue_stats['depth']},
+                {'key': 'queue_max_depth', 'value': queue_stats['max_depth']},
+                {'key': 'queue_dropped', 'value': queue_stats['dropped'] + queue_stats['coalesced']},
+                {'key': 'queue_lag_ms', 'value': round(queue_stats['lag_avg'] * 1000.0, 1)},
+                {'key': 'queue_lag_max_ms', 'value': round(queue_stats['lag_max'] * 1000.0, 1)},
+                {'key': 'events_total', 'value': metrics.total_events()},
+                {'key': 'pipeline_p50_ms', 'value': metrics.pipeline.percentile(50)},
+                {'key': 'pipeline_p95_ms', 'value': metrics.pipeline.percentile(95)},
+                {'key': 'slowest_stage', 'value': metrics.slowest_stage()},
+                {'key': 'reconnects', 'value': camect.reconnects},
+                {'key': 'state_writes', 'value': writer_stats['writes']},
+                {'key': 'state_writes_saved', 'value': writer_stats['saved']},
+                {'key': 'events_filtered', 'value': event_filter.stats()['dropped']},
+                {'key': 'live_threads', 'value': camect.live_threads()},
+                {'key': 'snapshot_cache_hits', 'value': cache_stats['hits']},
+                {'key': 'snapshot_cache_misses', 'value': cache_stats['misses']},
+                {'key': 'snapshot_cache_hit_rate', 'value': cache_stats['hit_rate']},
+                {'key': 'prefetch_p50_ms', 'value': cache_stats['prefetch_p50_ms']},
+                {'key': 'prefetch_p95_ms', 'value': cache_stats['prefetch_p95_ms']},
+                {'key': 'action_queue_depth', 'value': action_stats['depth']},
+                {'key': 'action_queue_max_depth', 'value': action_stats['max_depth']},
+                {'key': 'action_p50_ms', 'value': action_stats['latency_p50_ms']},
+                {'key': 'action_p95_ms', 'value': action_stats['latency_p95_ms']},
+                {'key': 'ping_rtt_ms', 'value': health['rtt_avg_ms']},
+                {'key': 'ping_rtt_p95_ms', 'value': health['rtt_p95_ms']},
+                {'key': 'event_interval_s', 'value': health['interval_avg_s']},
+                {'key': 'event_interval_p95_s', 'value': health['interval_p95_s']},
+                {'key': 'stale_links', 'value': health['stale_count']},
+                {'key': 'last_failover_s', 'value': health['last_failover_s']}
+            ]
+            if self.camects.get(devID) is camect:
+                indigo.devices[devID].updateStatesOnServer(key_value_list)
 
     def deviceStartComm(self, device):
 
@@ -53,47 +243,195 @@ class Plugin(indigo.PluginBase):
             device.updateStateOnServer(key="status", value="None")
             device.updateStateImageOnServer(indigo.kStateImageSel.SensorOff)
 
-            self.camects[device.id] = Camect(hub_id=device.id,
-                                             address=device.pluginProps.get('address', ''),
-                                             port=device.pluginProps.get('port', '443'),
-                                             username=device.pluginProps.get('username', 'Indigo'),
-                                             password=device.pluginProps.get('password', 'Indigo'),
-                                             delegate=self
-                                             )
+            try:
+                window = float(device.pluginProps.get('dedupWindow', 5.0))
+            except ValueError:
+                window = 5.0
+            self.dedup.set_window(device.id, window, parse_camera_windows(device.pluginProps.get('dedupCameraWindows', '')))
+
+            # warm start from the cached hub info, so menus and actions work before the hub answers
+            info, cameras = self.metadata_cache.load(device.id)
+            if info is not None:
+                self.camect_info[device.id] = info
+                self.camect_cameras[device.id] = cameras
+                self.logger.debug(f"{device.name}: Loaded {len(cameras)} cameras from cache")
 
-            self.sleep(2)   # wait for connection
+            try:
+                history_size = int(device.pluginProps.get('historySize', DEFAULT_HISTORY_SIZE))
+            except ValueError:
+                history_size = DEFAULT_HISTORY_SIZE
+            if device.id not in self.event_history or self.event_history[device.id].size != history_size:
+                self.event_history[device.id] = EventHistory(history_size)
 
-            # Make sure it connects.
-            info = self.camects[device.id].get_info()
-            if not info:
-                self.logger.warning("Camect get_info returned no data")
-                return
+            try:
+                state_window = float(device.pluginProps.get('stateWindow', 0.0))
+            except ValueError:
+                state_window = 0.0
+            self.state_writers[device.id] = StateWriter(device.name, indigo.devices[device.id].updateStatesOnServer,
+                                                        window=state_window)
 
-            self.camect_info[device.id] = info
-            self.logger.debug(f"Hub info:\n{json.dumps(info, sort_keys=True, indent=4)}")
+            if device.pluginProps.get('prefetchSnapshots', False):
+                self.prefetch_hubs.add(device.id)
+            else:
+                self.prefetch_hubs.discard(device.id)
 
-            key_value_list = [
-                {'key': 'name', 'value': info['name']},
-                {'key': 'cloud_url', 'value': info['cloud_url']},
-                {'key': 'local_https_url', 'value': info['local_https_url']},
-                {'key': 'mode', 'value': info['mode']},
-                {'key': 'id', 'value': info['id']}
-            ]
-            device.updateStatesOnServer(key_value_list)
+            self.event_filters[device.id] = EventFilter()
+            self.update_event_filter(device.id)
+            self.action_queues[device.id] = ActionQueue(device.name)
+
+            self.camects[device.id] = self.create_client(device)
 
-            self.camect_cameras[device.id] = {}
-            self.logger.debug("Known Cameras:")
-            for cam in self.camects[device.id].list_cameras():
-                self.camect_cameras[device.id][cam['id']] = cam
-                self.logger.debug(f"Camera {cam['name']}:\n{json.dumps(cam, sort_keys=True, indent=4)}")
+            # bring the hub up in the background, so one slow or unreachable hub doesn't hold up the others
+            try:
+                startup_timeout = float(device.pluginProps.get('startupTimeout', 10.0))
+            except ValueError:
+                startup_timeout = 10.0
+            threading.Thread(target=self.hub_startup, args=(device.id, startup_timeout), name=f"Startup-{device.id}",
+                             daemon=True).start()
         else:
             self.logger.warning(f"{device.name}: deviceStartComm: Invalid device type: {device.deviceTypeId}")
 
+    def create_client(self, device):
+        props = device.pluginProps
+        address, port = props.get('address', ''), props.get('port', '443')
+        resolved = self.resolve_hub(device.id)
+        if resolved and resolved != address:
+            self.logger.info(f"{device.name}: Using discovered address {resolved}")
+            address = resolved
+        kwargs = dict(hub_id=device.id,
+                      address=address,
+                      port=port,
+                      username=props.get('username', 'Indigo'),
+                      password=props.get('password', 'Indigo'),
+                      delegate=self,
+                      pool_size=int(props.get('poolSize', 4)),
+                      retries=int(props.get('requestRetries', 2)),
+                      timeout=float(props.get('requestTimeout', 10.0)),
+                      queue_size=int(props.get('queueSize', 256)),
+                      queue_policy=props.get('queueOverflow', 'drop_oldest'),
+                      event_filter=self.event_filters.get(device.id),
+                      ping_interval=float(props.get('pingInterval', 5.0)),
+                      pong_timeout=float(props.get('pongTimeout', 12.0)))
+
+        if self.pluginPrefs.get("transport", "threaded") == "asyncio":
+            if AsyncCamect:
+                if not self.async_transport:
+                    # one loop for all hubs, each hub has its own event queue
+                    self.async_transport = AsyncTransport()
+                return AsyncCamect(transport=self.async_transport, **kwargs)
+            self.logger.warning(f"{device.name}: asyncio transport requires aiohttp, using threaded transport")
+
+        return Camect(**kwargs)
+
+    def resolve_hub(self, dev_id):
+        """ Discovered address for a hub device, if it opted in to discovery and the hub has been seen before.
+        The configured port is kept, it may be forwarded.
+        """
+        info = self.camect_info.get(dev_id)
+        if not self.discovery or not info or not indigo.devices[dev_id].pluginProps.get('useDiscovery', False):
+            return None
+        resolved = self.discovery.resolve(info['id'])
+        return resolved[0] if resolved else None
+
+    def hub_moved(self, hub_id, address, port):
+        # called from the discovery thread
+        for devID, info in list(self.camect_info.items()):
+            if info.get('id') == hub_id and devID in self.camects:
+                camect = self.camects[devID]
+                # compare with where the websocket last connected, not the configured address
+                if not indigo.devices[devID].pluginProps.get('useDiscovery', False) or \
+                        address in (camect.connected_address, camect.address):
+                    continue
+                self.logger.info(f"{indigo.devices[devID].name}: Hub address changed to {address}, reconnecting")
+                camect.set_address(address, camect.port)
+
+    def hub_startup(self, dev_id, timeout):
+        device = indigo.devices[dev_id]
+        camect = self.camects.get(dev_id)
+        if not camect:
+            return
+        start = datetime.now()
+
+        if not camect.wait_ready(timeout):
+            self.logger.warning(f"{device.name}: websocket not connected after {timeout} seconds")
+        ready_time = (datetime.now() - start).total_seconds()
+
+        # Make sure it connects.
+        info = camect.get_info()
+        if not info:
+            self.logger.warning(f"{device.name}: Camect get_info returned no data")
+            return
+        # runs on its own thread, the device may have been stopped or restarted meanwhile
+        if self.camects.get(dev_id) is not camect:
+            return
+
+        if info != self.camect_info.get(dev_id):
+            self.camect_info[dev_id] = info
+            self.metadata_cache.save(dev_id, info, self.camect_cameras.get(dev_id, {}))
+        self.logger.debug(f"Hub info:\n{json.dumps(info, sort_keys=True, indent=4)}")
+
+        key_value_list = [
+            {'key': 'name', 'value': info['name']},
+            {'key': 'cloud_url', 'value': info['cloud_url']},
+            {'key': 'local_https_url', 'value': info['local_https_url']},
+            {'key': 'mode', 'value': info['mode']},
+            {'key': 'id', 'value': info['id']}
+        ]
+        writer = self.state_writers.get(dev_id)
+        if writer is None:
+            return
+        writer.update(key_value_list)
+        info_time = (datetime.now() - start).total_seconds()
+
+        if self.camects.get(dev_id) is not camect or not self.refresh_cameras(dev_id):
+            return
+
+        self.logger.info(f"{device.name}: Started in {(datetime.now() - start).total_seconds():.2f} seconds "
+                         f"(connected {ready_time:.2f}, info {info_time:.2f}, "
+                         f"{len(self.camect_cameras.get(dev_id, {}))} cameras)")
+
+    def refresh_cameras(self, dev_id):
+        device = indigo.devices[dev_id]
+        camect = self.camects.get(dev_id)
+        if not camect:
+            return False
+
+        cameras = camect.list_cameras()
+        if cameras is None:
+            self.logger.warning(f"{device.name}: Camect list_cameras returned no data")
+            return False
+
+        new = {cam['id']: cam for cam in cameras}
+        known = self.camect_cameras.setdefault(dev_id, {})
+        added, removed, changed = diff_cameras(known, new)
+        for cam_id in added + changed:
+            known[cam_id] = new[cam_id]
+            self.logger.debug(f"Camera {new[cam_id]['name']}:\n{json.dumps(new[cam_id], sort_keys=True, indent=4)}")
+        for cam_id in removed:
+            del known[cam_id]
+        for cam_id, cam in new.items():
+            if 'is_alert_disabled' in cam:
+                self.alert_state.event(dev_id, cam_id, not cam['is_alert_disabled'])
+
+        if added or removed or changed:
+            self.logger.info(f"{device.name}: Cameras updated, {len(added)} added, {len(removed)} removed, {len(changed)} changed")
+            if dev_id in self.camect_info:
+                self.metadata_cache.save(dev_id, self.camect_info[dev_id], known)
+        return True
+
     def deviceStopComm(self, device):
 
         if device.deviceTypeId == "camect":
             self.logger.info(f"{device.name}: Stopping Device")
+            self.camects[device.id].close()
             del self.camects[device.id]
+            self.dedup.forget_hub(device.id)
+            self.alert_state.forget_hub(device.id)
+            self.image_cache.forget_hub(device.id)
+            self.prefetch_hubs.discard(device.id)
+            self.state_writers.pop(device.id).flush()
+            self.event_filters.pop(device.id, None)
+            self.action_queues.pop(device.id).stop(timeout=1.0)
             device.updateStateOnServer(key="status", value="Stopped")
             device.updateStateImageOnServer(indigo.kStateImageSel.SensorOff)
         else:
@@ -111,116 +449,124 @@ class Plugin(indigo.PluginBase):
         device.updateStateOnServer(key="status", value="Error")
         device.updateStateImageOnServer(indigo.kStateImageSel.SensorTripped)
 
-    def hub_message(self, dev_id=None, message=None):
+    def hub_message(self, dev_id=None, message=None, received=None):
+        metrics = self.metrics.setdefault(dev_id, HubMetrics())
+        start = metrics.mark()
+        if received:
+            metrics.record_receive(received)
+        try:
+            self.process_event(dev_id, message, metrics, start)
+        finally:
+            metrics.record_pipeline(start)
+
+    def process_event(self, dev_id, message, metrics, mark):
         device = indigo.devices[dev_id]
         try:
             event = json.loads(message)
         except Exception as err:
             self.logger.error(f"{device.name}: Invalid JSON '{message}': {err}")
             return
+        mark = metrics.lap("parse", mark)
+        metrics.count(event['type'])
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"{device.name}: {event['type']} Event:\n{json.dumps(event, sort_keys=True, indent=4)}")
 
-        self.logger.debug(f"{device.name}: {event['type']} Event:\n{json.dumps(event, sort_keys=True, indent=4)}")
+        history = self.event_history.get(dev_id)
+        writer = self.state_writers[dev_id]
+        if event['type'] != 'alert':
+            if history is not None:
+                history.add(event)
+            if self.event_store:
+                self.event_store.add(dev_id, event)
 
         if event['type'] == 'alert':
             self.logger.debug(f"{device.name}: {event['desc']}")
 
-            if (datetime.now() - self.last_event_time).total_seconds() < self.last_event_delay and \
-                event['type'] == self.last_event['type'] and \
-                event['cam_id'] == self.last_event['cam_id'] and \
-                event['desc'] == self.last_event['desc'] and \
-                event['detected_obj'] == self.last_event['detected_obj']:
+            duplicate = self.dedup.is_duplicate(device.id, event)
+            mark = metrics.lap("dedup", mark)
+            if duplicate:
                 self.logger.debug(f"{device.name}: Duplicate event, skipping")
                 return
+            if history is not None:
+                history.add(event)
+            if self.event_store:
+                self.event_store.add(dev_id, event)
 
-            self.logger.debug(f"{device.name}: Processing event for triggers")
+            # fetch the snapshot now, so a snapshot action run by the triggers below is served from the cache
+            if dev_id in self.prefetch_hubs and self.image_cache.start_prefetch(dev_id, event['cam_id']):
+                self.prefetch_executor.submit(self.prefetch_snapshot, dev_id, event['cam_id'])
 
-            self.last_event = event
-            self.last_event_time = datetime.now()
+            self.logger.debug(f"{device.name}: Processing event for triggers")
 
             key_value_list = [
                 {'key': 'last_event', 'value': message},
                 {'key': 'last_event_time', 'value': datetime.now().strftime(TS_FORMAT)},
                 {'key': 'last_event_type', 'value': event['type']},
-                {'key': 'mode', 'value': ""},
                 {'key': 'last_event_cam_id', 'value': event['cam_id']},
                 {'key': 'last_event_cam_name', 'value': event['cam_name']},
                 {'key': 'last_event_desc', 'value': event['desc']},
                 {'key': 'last_event_url', 'value': event['url']},
                 {'key': 'last_event_detected', 'value': ' '.join(event['detected_obj'])}
             ]
-            device.updateStatesOnServer(key_value_list)
-
-            for triggerID in self.alert_triggers:
-                trigger = self.alert_triggers[triggerID]
-                self.logger.threaddebug(
-                    f"Checking Alert trigger {triggerID}: camectID: {trigger.pluginProps['camectID']}, cam_id: {trigger.pluginProps['cameraID']}, object = {trigger.pluginProps['object']}")
-
-                if not ((trigger.pluginProps["camectID"] == "-1") or (
-                        trigger.pluginProps["camectID"] == str(device.id))):
-                    self.logger.threaddebug(f"Skipping Alert trigger {triggerID}, wrong Camect")
-                    continue
-
-                if not ((trigger.pluginProps["cameraID"] == "-1") or (
-                        trigger.pluginProps["cameraID"] == event['cam_id'])):
-                    self.logger.threaddebug(f"Skipping Alert trigger {triggerID}, wrong camera")
-                    continue
-
-                if trigger.pluginProps["object"] == "-1":
-                    self.logger.debug(f"Executing Any Object Alert trigger {triggerID}")
-                    indigo.trigger.execute(trigger)
-                    continue
-
-                for obj in trigger.pluginProps["object"]:
-                    if obj in ' '.join(event['detected_obj']):
-                        self.logger.debug(f"Executing Alert trigger {triggerID} for object {obj}")
-                        indigo.trigger.execute(trigger)
-                        break
+            writer.update(key_value_list)
+            mark = metrics.lap("state", mark)
+
+            # the index narrows to triggers for this hub, camera and objects, then each one's predicate decides
+            triggers = self.alert_triggers.lookup(str(device.id), event['cam_id'], event['detected_obj'])
+            if triggers:
+                objects = frozenset(event['detected_obj'])
+                now = datetime.now()
+                minute = now.hour * 60 + now.minute
+                triggers = [(triggerID, trigger) for triggerID, trigger in triggers.items()
+                            if self.alert_predicates[triggerID].matches(objects, minute)
+                            and self.alert_predicates[triggerID].fire()]
+            mark = metrics.lap("match", mark)
+            if triggers:
+                # trigger actions read the last_event states, so write this event's now rather than at the window's end
+                writer.flush()
+            for triggerID, trigger in triggers:
+                self.logger.debug(f"Executing Alert trigger {triggerID} for objects {event['detected_obj']}")
+                indigo.trigger.execute(trigger)
+            metrics.lap("execute", mark)
 
         elif event['type'] == 'alert_enabled' or event['type'] == 'alert_disabled':
+            self.alert_state.event(dev_id, event['cam_id'], event['type'] == 'alert_enabled')
             key_value_list = [
                 {'key': 'last_event', 'value': message},
                 {'key': 'last_event_time', 'value': datetime.now().strftime(TS_FORMAT)},
                 {'key': 'last_event_type', 'value': event['type']},
-                {'key': 'mode', 'value': ""},
                 {'key': 'last_event_cam_id', 'value': event['cam_id']},
                 {'key': 'last_event_cam_name', 'value': event['cam_name']},
                 {'key': 'last_event_desc', 'value': ""},
                 {'key': 'last_event_url', 'value': ""},
                 {'key': 'last_event_detected', 'value': ""}
             ]
-            device.updateStatesOnServer(key_value_list)
+            writer.update(key_value_list)
+            metrics.lap("state", mark)
 
         elif event['type'] == 'camera_offline' or event['type'] == 'camera_online':
             key_value_list = [
                 {'key': 'last_event', 'value': message},
                 {'key': 'last_event_time', 'value': datetime.now().strftime(TS_FORMAT)},
                 {'key': 'last_event_type', 'value': event['type']},
-                {'key': 'mode', 'value': ""},
                 {'key': 'last_event_cam_id', 'value': event['cam_id']},
                 {'key': 'last_event_cam_name', 'value': event['cam_name']},
                 {'key': 'last_event_desc', 'value': ""},
                 {'key': 'last_event_url', 'value': ""},
                 {'key': 'last_event_detected', 'value': ""}
             ]
-            device.updateStatesOnServer(key_value_list)
-
-            for triggerID, trigger in self.camera_triggers.items():
-                self.logger.threaddebug(
-                    f"Checking Camera trigger {triggerID}: camectID: {trigger.pluginProps['camectID']}")
-
-                if not ((trigger.pluginProps["camectID"] == "-1") or (
-                        trigger.pluginProps["camectID"] == str(device.id))):
-                    self.logger.threaddebug(f"Skipping Camera trigger {triggerID}, wrong Camect")
-                    continue
-
-                if not ((trigger.pluginProps["cameraID"] == "-1") or (
-                        trigger.pluginProps["cameraID"] == event['cam_id'])):
-                    self.logger.threaddebug(f"Skipping Camera trigger {triggerID}, wrong camera")
-                    continue
-
-                if trigger.pluginProps["type"] == event['type']:
-                    self.logger.debug(f"Executing Camera trigger {triggerID}")
-                    indigo.trigger.execute(trigger)
+            writer.update(key_value_list)
+            mark = metrics.lap("state", mark)
+
+            triggers = self.camera_triggers.lookup(str(device.id), event['cam_id'], event['type'])
+            mark = metrics.lap("match", mark)
+            if triggers:
+                writer.flush()
+            for triggerID, trigger in triggers.items():
+                self.logger.debug(f"Executing Camera trigger {triggerID}")
+                indigo.trigger.execute(trigger)
+            metrics.lap("execute", mark)
 
         elif event['type'] == 'mode':
             key_value_list = [
@@ -234,15 +580,17 @@ class Plugin(indigo.PluginBase):
                 {'key': 'last_event_url', 'value': ""},
                 {'key': 'last_event_detected', 'value': ""}
             ]
-            device.updateStatesOnServer(key_value_list)
-
-            for triggerID, trigger in self.mode_triggers.items():
-                self.logger.threaddebug(
-                    f"Checking Mode trigger {triggerID}: camectID: {trigger.pluginProps['camectID']}")
-
-                if (trigger.pluginProps["camectID"] == "-1") or (trigger.pluginProps["camectID"] == str(device.id)):
-                    self.logger.debug(f"Executing Mode trigger {triggerID}")
-                    indigo.trigger.execute(trigger)
+            writer.update(key_value_list)
+            mark = metrics.lap("state", mark)
+
+            triggers = self.mode_triggers.lookup(str(device.id))
+            mark = metrics.lap("match", mark)
+            if triggers:
+                writer.flush()
+            for triggerID, trigger in triggers.items():
+                self.logger.debug(f"Executing Mode trigger {triggerID}")
+                indigo.trigger.execute(trigger)
+            metrics.lap("execute", mark)
 
         else:
             self.logger.warning(f"Unknown event type: {event['type']}")
@@ -253,36 +601,72 @@ class Plugin(indigo.PluginBase):
 
     def triggerStartProcessing(self, trigger):
         self.logger.debug(f"{trigger.name}: Adding {trigger.pluginTypeId} Trigger")
+        props = trigger.pluginProps
         if trigger.pluginTypeId == "alertEvent":
             assert trigger.id not in self.alert_triggers
-            self.alert_triggers[trigger.id] = trigger
+            try:
+                self.alert_predicates[trigger.id] = AlertPredicate.from_props(props)
+            except ValueError as err:
+                self.logger.error(f"{trigger.name}: Invalid trigger settings: {err}")
+                return
+            self.alert_triggers.add(trigger.id, trigger, props["camectID"], props["cameraID"], props.get("object", []))
         elif trigger.pluginTypeId == "modeEvent":
             assert trigger.id not in self.mode_triggers
-            self.mode_triggers[trigger.id] = trigger
+            self.mode_triggers.add(trigger.id, trigger, props["camectID"])
         elif trigger.pluginTypeId == "cameraEvent":
             assert trigger.id not in self.camera_triggers
-            self.camera_triggers[trigger.id] = trigger
+            self.camera_triggers.add(trigger.id, trigger, props["camectID"], props["cameraID"], props["type"])
+        # widen the filters by this trigger alone, rather than rescanning every trigger for every hub
+        for devID, event_filter in list(self.event_filters.items()):
+            event_filter.add(build_subscription(devID, [(trigger.pluginTypeId, props)]))
+
+    def update_event_filter(self, dev_id):
+        event_filter = self.event_filters.get(dev_id)
+        if not event_filter:
+            return
+        props = indigo.devices[dev_id].pluginProps
+        trigger_props = [(trigger.pluginTypeId, trigger.pluginProps)
+                         for index in (self.alert_triggers, self.camera_triggers, self.mode_triggers)
+                         for trigger in index.triggers()]
+        event_filter.update(build_subscription(dev_id, trigger_props, props.get('eventAllowList', '')),
+                            enabled=props.get('earlyFilter', False))
 
     def triggerStopProcessing(self, trigger):
         self.logger.debug(f"{trigger.name}: Removing {trigger.pluginTypeId} Trigger")
         if trigger.pluginTypeId == "alertEvent":
-            assert trigger.id in self.alert_triggers
-            del self.alert_triggers[trigger.id]
+            self.alert_triggers.remove(trigger.id)
+            self.alert_predicates.pop(trigger.id, None)
         elif trigger.pluginTypeId == "modeEvent":
             assert trigger.id in self.mode_triggers
-            del self.mode_triggers[trigger.id]
+            self.mode_triggers.remove(trigger.id)
         elif trigger.pluginTypeId == "cameraEvent":
             assert trigger.id in self.camera_triggers
-            del self.camera_triggers[trigger.id]
+            self.camera_triggers.remove(trigger.id)
+        # a filter that is too wide only lets extra events through, so narrow it once the changes settle
+        self.stale_filters.update(self.event_filters)
 
     ########################################
     # Plugin Actions object callbacks (pluginAction is an Indigo plugin action instance)
     ########################################
 
+    def queue_action(self, camectID, key, func, *args, coalesce=None):
+        """ Hand an action to the hub's worker, so the Indigo action thread isn't held up by the request.
+        """
+        queue = self.action_queues.get(camectID)
+        if not queue:
+            self.logger.warning(f"{key[0]} action for hub {camectID} ignored, hub is not running")
+            return False
+        if not queue.submit(key, func, *args, coalesce=coalesce):
+            self.logger.debug(f"{indigo.devices[camectID].name}: {key} already queued or running")
+            return False
+        return True
+
     def setModeCommand(self, pluginAction):
         camectID = int(pluginAction.props['camectID'])
         self.logger.debug(f"setModeCommand, new mode: {pluginAction.props['mode']}")
-        self.camects[camectID].set_mode(pluginAction.props['mode'])
+        self.queue_action(camectID, ("mode", pluginAction.props['mode']),
+                          lambda mode: self.camects[camectID].set_mode(mode), pluginAction.props['mode'],
+                          coalesce=("mode",))
 
     def ptzCameraCommand(self, pluginAction):
         camectID = int(pluginAction.props['camectID'])
@@ -301,7 +685,10 @@ class Plugin(indigo.PluginBase):
             return
 
         self.logger.debug(f"ptzCameraCommand, action: {pluginAction.props['ptz_action']}")
-        self.camects[camectID].ptz(camera['id'], pluginAction.props['ptz_action'])
+        # queued moves for the same camera collapse to the latest one
+        self.queue_action(camectID, ("ptz", camera['id'], pluginAction.props['ptz_action']),
+                          lambda cam_id, action: self.camects[camectID].ptz(cam_id, action),
+                          camera['id'], pluginAction.props['ptz_action'], coalesce=("ptz", camera['id']))
 
     def snapshotCameraCommand(self, pluginAction):
         camectID = int(pluginAction.props['camectID'])
@@ -326,17 +713,145 @@ class Plugin(indigo.PluginBase):
 
         self.logger.debug(f"{camect.name}: snapshotCameraCommand, camera: {camera['name']} ({camera['id']})")
 
+        save_path = f"{indigo.server.getInstallFolderPath()}/{snapshotPath}/{snapshotName}.jpg"
+        self.queue_action(camectID, ("snapshot", camera['id'], save_path), self.take_snapshot, camectID, camera, save_path)
+
+    def snapshotAllCommand(self, pluginAction):
+        camectID = pluginAction.props.get('camectID', "-1")
+        hubs = list(self.camects) if camectID == "-1" else [int(camectID)]
+        try:
+            workers = int(pluginAction.props.get('maxWorkers', SNAPSHOT_WORKERS))
+        except ValueError:
+            workers = SNAPSHOT_WORKERS
+        # spans hubs, so it runs on its own thread rather than a hub's action worker
+        threading.Thread(target=self.snapshot_all, args=(hubs, workers), name="SnapshotAll", daemon=True).start()
+
+    def snapshot_all(self, hubs, workers):
+        jobs = []
+        for hubID in hubs:
+            for camera in self.camect_cameras.get(hubID, {}).values():
+                if not camera['disabled']:
+                    jobs.append((hubID, camera))
+        if not jobs:
+            self.logger.warning("snapshotAllCommand: no enabled cameras")
+            return
+
+        snapshotPath = self.pluginPrefs.get("snapshotPath", "IndigoWebServer/public")
+        folder = f"{indigo.server.getInstallFolderPath()}/{snapshotPath}"
+        start = datetime.now()
+
+        def snapshot(hubID, camera):
+            cam_start = datetime.now()
+            if not self.take_snapshot(hubID, camera, f"{folder}/snapshot-{camera['id']}.jpg"):
+                raise IOError("snapshot failed")
+            return (datetime.now() - cam_start).total_seconds()
+
+        failures = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs))), thread_name_prefix="Snapshot") as executor:
+            futures = {executor.submit(snapshot, hubID, camera): (hubID, camera) for hubID, camera in jobs}
+            for future in as_completed(futures):
+                hubID, camera = futures[future]
+                try:
+                    elapsed = future.result()
+                    self.logger.debug(f"{indigo.devices[hubID].name}: snapshot {camera['name']} ({camera['id']}) in {elapsed:.2f} seconds")
+                except Exception as err:
+                    failures += 1
+                    self.logger.warning(f"{indigo.devices[hubID].name}: snapshot {camera['name']} ({camera['id']}) failed: {err}")
+
+        self.logger.info(f"Snapshot of {len(jobs)} cameras completed in {(datetime.now() - start).total_seconds():.2f} seconds, {failures} failed")
+
+    def prefetch_snapshot(self, camectID, cam_id):
+        image = None
+        try:
+            camera = self.camect_cameras.get(camectID, {}).get(cam_id)
+            camect = self.camects.get(camectID)
+            if camera and camect and not camera['disabled']:
+                image = camect.snapshot_camera(cam_id, camera['width'], camera['height'])
+        except Exception as err:
+            self.logger.debug(f"prefetch_snapshot error for {cam_id}: {err}")
+        finally:
+            self.image_cache.finish_prefetch(camectID, cam_id, image)
+
+    def take_snapshot(self, camectID, camera, save_path):
+        saved = self.fetch_snapshot(camectID, camera, save_path)
+        if saved and self.snapshot_processor:
+            self.snapshot_processor.submit(save_path)
+        return saved
+
+    def fetch_snapshot(self, camectID, camera, save_path):
+        if camectID in self.prefetch_hubs:
+            image = self.image_cache.get(camectID, camera['id'], wait=self.camects[camectID].timeout)
+            if image:
+                self.logger.debug(f"take_snapshot: {camera['name']} served from cache")
+                return self.save_snapshot(save_path, image)
+
+        if self.pluginPrefs.get("streamSnapshots", False):
+            return self.camects[camectID].snapshot_camera_to_file(camera['id'], save_path, camera['width'], camera['height']) is not None
+
         image = self.camects[camectID].snapshot_camera(camera['id'], camera['width'], camera['height'])
         if not image:
-            return
+            return False
+        return self.save_snapshot(save_path, image)
 
-        save_path = f"{indigo.server.getInstallFolderPath()}/{snapshotPath}/{snapshotName}.jpg"
+    def save_snapshot(self, save_path, image):
+        # write to a temp file and rename, so readers never see a partial image
         try:
-            f = open(save_path, 'wb')
-            f.write(image)
-            f.close()
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(save_path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(image)
+                os.replace(temp_path, save_path)
+            except Exception:
+                os.unlink(temp_path)
+                raise
         except Exception as err:
             self.logger.warning(f"Error writing image file: {save_path}, err: {err}")
+            return False
+        return True
+
+    # plugin API: indigo.server.getPlugin("com.flyingdiver.indigoplugin.camect").executeAction("queryEvents",
+    #     props={'camectID': hubDeviceId, 'cameraID': "...", 'minutes': 10}, waitUntilDone=True)
+    def queryEventsCommand(self, pluginAction):
+        props = pluginAction.props
+        return self.query_events(props['camectID'], cam_id=props.get('cameraID'), event_type=props.get('type'),
+                                 obj=props.get('object'), minutes=props.get('minutes'), limit=props.get('limit'))
+
+    def query_events(self, camectID, cam_id=None, event_type=None, obj=None, minutes=None, limit=None):
+        """ Recent events for a hub, newest first.  "-1" or empty for any value is treated as no filter.
+        """
+        history = self.event_history.get(int(camectID))
+        if history is None:
+            return []
+        since = datetime.now().timestamp() - float(minutes) * 60.0 if minutes else None
+        return history.query(cam_id=cam_id if cam_id not in (None, "", "-1") else None,
+                             event_type=event_type if event_type not in (None, "", "-1") else None,
+                             obj=obj if obj not in (None, "", "-1") else None,
+                             since=since, limit=int(limit) if limit else None)
+
+    # plugin API: indigo.server.getPlugin("com.flyingdiver.indigoplugin.camect").executeAction("eventCounts",
+    #     props={'camectID': hubDeviceId, 'period': "day", 'days': 7, 'groupBy': ["cam_id", "object"]}, waitUntilDone=True)
+    def eventCountsCommand(self, pluginAction):
+        props = pluginAction.props
+        return self.event_counts(props.get('camectID'), period=props.get('period', "day"), days=props.get('days'),
+                                 group_by=props.get('groupBy', ["cam_id"]), cam_id=props.get('cameraID'),
+                                 event_type=props.get('type'), obj=props.get('object'))
+
+    def event_counts(self, camectID=None, period="day", days=None, group_by=("cam_id",), cam_id=None,
+                     event_type=None, obj=None):
+        """ Event counts per hour or day from the event store, oldest first.  "-1" or empty for any value is
+        treated as no filter.
+        """
+        if not self.event_store:
+            return []
+
+        def value(item):
+            return item if item not in (None, "", "-1") else None
+
+        hub = value(camectID)
+        since = datetime.now().timestamp() - float(days) * 86400.0 if days else None
+        return self.event_store.counts(hub_id=int(hub) if hub else None, period=period, since=since,
+                                       group_by=group_by, cam_id=value(cam_id), event_type=value(event_type),
+                                       obj=value(obj))
 
     def disableAlertsCommand(self, pluginAction):
         camectID = int(pluginAction.props['camectID'])
@@ -344,9 +859,13 @@ class Plugin(indigo.PluginBase):
         cameraID = pluginAction.props['cameraID']
         if cameraID == "-1":
             cameraID = []
+        else:
+            cameraID = [cameraID]
         self.logger.debug(
             f"{camect.name}: disableAlertsCommand, camera: {cameraID}, reason: {pluginAction.props['reason']}")
-        self.camects[camectID].disable_alert([pluginAction.props['cameraID']], pluginAction.props['reason'])
+        self.queue_action(camectID, ("alerts", False, tuple(cameraID), pluginAction.props['reason']),
+                          self.set_alerts, camectID, cameraID, False, pluginAction.props['reason'],
+                          coalesce=("alerts", tuple(cameraID), pluginAction.props['reason']))
 
     def enableAlertsCommand(self, pluginAction):
         camectID = int(pluginAction.props['camectID'])
@@ -354,9 +873,60 @@ class Plugin(indigo.PluginBase):
         cameraID = pluginAction.props['cameraID']
         if cameraID == "-1":
             cameraID = []
+        else:
+            cameraID = [cameraID]
         self.logger.debug(
             f"{camect.name}: enableAlertsCommand, camera: {cameraID}, reason: {pluginAction.props['reason']}")
-        self.camects[camectID].enable_alert([pluginAction.props['cameraID']], pluginAction.props['reason'])
+        self.queue_action(camectID, ("alerts", True, tuple(cameraID), pluginAction.props['reason']),
+                          self.set_alerts, camectID, cameraID, True, pluginAction.props['reason'],
+                          coalesce=("alerts", tuple(cameraID), pluginAction.props['reason']))
+
+    def set_alerts(self, camectID, cam_ids, enable, reason):
+        camect = self.camects[camectID]
+        result = camect.enable_alert(cam_ids, reason) if enable else camect.disable_alert(cam_ids, reason)
+        if result is None:
+            self.logger.warning(f"{indigo.devices[camectID].name}: {'enable' if enable else 'disable'} alerts failed")
+            return False
+        self.alert_state.applied(camectID, cam_ids, enable, reason)
+        return True
+
+    def bulkAlertsCommand(self, pluginAction):
+        """ Enable or disable alerts on several cameras across several hubs, one EnableAlert call per hub,
+        queued on each hub's action worker so the hubs run concurrently.  Cameras already known to be in
+        the requested state are skipped.
+        """
+        props = pluginAction.props
+        enable = props.get('alertAction', 'disable') == 'enable'
+        reason = props.get('reason', '')
+        selected = list(props.get('cameraIDs', []))
+
+        hubs = [int(hubID) for hubID in props.get('camectIDs', []) if int(hubID) in self.camects]
+        cameras = {}
+        for hubID in hubs:
+            if "-1" in selected:
+                cameras[hubID] = list(self.camect_cameras.get(hubID, {}))
+            else:
+                cameras[hubID] = [item.split(":", 1)[1] for item in selected if item.split(":", 1)[0] == str(hubID)]
+
+        jobs = {}
+        skipped = 0
+        for hubID, cam_ids in cameras.items():
+            needed = self.alert_state.needed(hubID, cam_ids, enable, reason)
+            skipped += len(cam_ids) - len(needed)
+            if needed:
+                jobs[hubID] = needed
+        if not jobs:
+            self.logger.info(f"bulkAlertsCommand: nothing to do, {skipped} cameras already {'enabled' if enable else 'disabled'}")
+            return
+
+        queued = 0
+        for hubID, cam_ids in jobs.items():
+            if self.queue_action(hubID, ("alerts", enable, tuple(cam_ids), reason), self.set_alerts, hubID, cam_ids, enable, reason,
+                                 coalesce=("alerts", tuple(cam_ids), reason)):
+                queued += len(cam_ids)
+
+        self.logger.info(f"{'Enable' if enable else 'Disable'} alerts queued for {queued} cameras on {len(jobs)} hubs, "
+                         f"{skipped} skipped")
 
     ########################################
     # ConfigUI methods
@@ -370,9 +940,78 @@ class Plugin(indigo.PluginBase):
                 self.logLevel = logging.INFO
             self.indigo_log_handler.setLevel(self.logLevel)
             self.logger.debug(f"logLevel = {self.logLevel}")
+            self.configure_image_cache(valuesDict)
+            self.configure_event_store(valuesDict)
+            self.configure_snapshot_processor(valuesDict)
+
+    def validatePrefsConfigUi(self, valuesDict):
+        errorsDict = indigo.Dict()
+        if valuesDict.get("snapshotDerivatives", False):
+            try:
+                parse_sizes(valuesDict.get("snapshotSizes", ""))
+            except ValueError as err:
+                errorsDict["snapshotSizes"] = f"Enter sizes as label:width:quality, separated by commas ({err})"
+            try:
+                if int(valuesDict.get("snapshotProcesses", DEFAULT_WORKERS)) < 1:
+                    raise ValueError
+            except ValueError:
+                errorsDict["snapshotProcesses"] = "Enter a number of processes, 1 or more"
+        if len(errorsDict) > 0:
+            return False, valuesDict, errorsDict
+        return True, valuesDict
+
+    def validateDeviceConfigUi(self, valuesDict, typeId, devId):
+        errorsDict = indigo.Dict()
+        # field: (type, minimum, error message)
+        numbers = {
+            'port': (int, 1, "Enter a port number"),
+            'startupTimeout': (float, 0.1, "Enter a number of seconds, more than 0"),
+            'poolSize': (int, 1, "Enter a number of connections, 1 or more"),
+            'requestTimeout': (float, 0.1, "Enter a number of seconds, more than 0"),
+            'requestRetries': (int, 0, "Enter a number of retries, 0 or more"),
+            'pingInterval': (float, 0.0, "Enter a number of seconds, 0 to turn off pings"),
+            'pongTimeout': (float, 0.0, "Enter a number of seconds, 0 to turn off the check"),
+            'queueSize': (int, 1, "Enter a number of events, 1 or more"),
+            'historySize': (int, 1, "Enter a number of events, 1 or more"),
+            'stateWindow': (float, 0.0, "Enter a number of seconds, 0 to write every change at once"),
+            'dedupWindow': (float, 0.0, "Enter a number of seconds, 0 for none"),
+        }
+        for field, (kind, minimum, message) in numbers.items():
+            if field not in valuesDict:
+                continue
+            try:
+                if kind(valuesDict[field]) < minimum or (field == 'port' and int(valuesDict[field]) > 65535):
+                    raise ValueError
+            except ValueError:
+                errorsDict[field] = message
+        if "pingInterval" not in errorsDict and "pongTimeout" not in errorsDict:
+            # a pong can only arrive after a ping, so a timeout at or under the interval drops healthy links
+            ping_interval = float(valuesDict.get('pingInterval', 5.0))
+            pong_timeout = float(valuesDict.get('pongTimeout', 12.0))
+            if ping_interval > 0 and 0 < pong_timeout <= ping_interval:
+                errorsDict["pongTimeout"] = "Enter a timeout longer than the ping interval, or 0 to turn off the check"
+        if len(errorsDict) > 0:
+            return False, valuesDict, errorsDict
+        return True, valuesDict
 
     def validateEventConfigUi(self, valuesDict, typeId, eventId):
         self.logger.debug(f"validateEventConfigUi typeId = {typeId}, eventId = {eventId}, valuesDict = {valuesDict}")
+        errorsDict = indigo.Dict()
+        if typeId == "alertEvent":
+            for field in ("startTime", "endTime"):
+                try:
+                    parse_time(valuesDict.get(field, ""))
+                except ValueError:
+                    errorsDict[field] = "Enter a time as HH:MM (24 hour), or leave blank"
+            if bool(valuesDict.get("startTime", "").strip()) != bool(valuesDict.get("endTime", "").strip()):
+                errorsDict["endTime"] = "Enter both a start and end time, or neither"
+            try:
+                if float(valuesDict.get("cooldown", 0) or 0) < 0:
+                    raise ValueError
+            except ValueError:
+                errorsDict["cooldown"] = "Enter a number of seconds, 0 for none"
+        if len(errorsDict) > 0:
+            return False, valuesDict, errorsDict
         return True, valuesDict
 
     def pickCamect(self, type_filter=None, valuesDict=None, typeId=0, targetId=0):
@@ -403,6 +1042,20 @@ class Plugin(indigo.PluginBase):
         retList.sort(key=lambda tup: tup[1])
         return retList
 
+    def pickCameras(self, type_filter=None, valuesDict=None, typeId=0, targetId=0):
+        # cameras from every selected Camect, as "camectID:cameraID"
+        self.logger.threaddebug(f"pickCameras typeId = {typeId}, targetId = {targetId}, valuesDict = {valuesDict}")
+        retList = []
+        try:
+            for camectID in valuesDict['camectIDs']:
+                device = indigo.devices[int(camectID)]
+                for cam in self.camect_cameras[int(camectID)].values():
+                    retList.append((f"{camectID}:{cam['id']}", f"{device.name}: {cam['name']}"))
+        except Exception as err:
+            pass
+        retList.sort(key=lambda tup: tup[1])
+        return [("-1", "- All Cameras -")] + retList
+
     def pickObject(self, type_filter=None, valuesDict=None, typeId=0, targetId=0):
         self.logger.threaddebug(f"pickObject typeId = {typeId}, targetId = {targetId}, valuesDict = {valuesDict}")
         if "Any" in type_filter:
@@ -427,7 +1080,8 @@ class Plugin(indigo.PluginBase):
     def getActionConfigUiValues(self, pluginProps, typeId, devId):
         valuesDict = pluginProps
         errorMsgDict = indigo.Dict()
-        if not pluginProps.get('camectID', None):
+        # snapshotAll defaults to all hubs ("-1"), bulkAlerts picks cameras across hubs
+        if typeId not in ("snapshotAll", "bulkAlerts") and not pluginProps.get('camectID', None) and self.camects:
             valuesDict["camectID"] = list(self.camects.keys())[0]
         return valuesDict, errorMsgDict
 
@@ -443,3 +1097,81 @@ class Plugin(indigo.PluginBase):
                                 json.dumps(self.camect_cameras[devID],sort_keys=True, indent=4, separators=(',', ': '))
                             ))
         return True
+
+    def queryEventHistory(self, valuesDict, typeId):
+        device = indigo.devices[int(valuesDict['camectID'])]
+        events = self.query_events(valuesDict['camectID'], cam_id=valuesDict.get('cameraID'),
+                                   event_type=valuesDict.get('type'), obj=valuesDict.get('object'),
+                                   minutes=valuesDict.get('minutes'))
+        lines = [f"{datetime.fromtimestamp(ev['time']).strftime(TS_FORMAT)}  {ev['type']:<16} {ev['cam_name'] or '':<20} "
+                 f"{' '.join(ev['objects'])}  {ev['desc']}" for ev in events]
+        self.logger.info(f"{device.name}: {len(events)} matching events:\n" + "\n".join(lines))
+        return True
+
+    def eventCountsReport(self, valuesDict, typeId):
+        if not self.event_store:
+            self.logger.warning("The event store is not enabled")
+            return True
+        groups = (("groupCamera", "cam_id"), ("groupType", "type"), ("groupObject", "object"))
+        group_by = [column for field, column in groups if valuesDict.get(field, False)]
+        counts = self.event_counts(valuesDict.get('camectID'), period=valuesDict.get('period', "day"),
+                                   days=valuesDict.get('days'), group_by=group_by,
+                                   event_type=valuesDict.get('type'))
+        bucket_format = "%Y-%m-%d %H:00" if valuesDict.get('period') == "hour" else "%Y-%m-%d"
+        lines = []
+        for row in counts:
+            hub = indigo.devices[row['hub']].name if row['hub'] in indigo.devices else str(row['hub'])
+            camera = self.camect_cameras.get(row['hub'], {}).get(row.get('cam_id'), {}).get('name', row.get('cam_id'))
+            columns = [datetime.fromtimestamp(row['bucket']).strftime(bucket_format), f"{hub:<20}"]
+            if 'cam_id' in row:
+                columns.append(f"{camera or '-':<20}")
+            if 'type' in row:
+                columns.append(f"{row['type']:<16}")
+            if 'object' in row:
+                columns.append(f"{row['object'] or '-':<12}")
+            columns.append(f"{row['count']:>6}")
+            lines.append("  ".join(columns))
+        self.logger.info(f"{len(counts)} event count rows:\n" + "\n".join(lines))
+        return True
+
+    def listDiscoveredHubs(self):
+        if not self.discovery:
+            self.logger.warning("Hub discovery is not enabled")
+            return True
+        configured = {info.get('id'): indigo.devices[devID].name for devID, info in self.camect_info.items()
+                      if devID in self.camects}
+        hubs = self.discovery.discovered()
+        lines = [f"{hub['name']:<24} {hub['id']:<24} {hub['address']}:{hub['port']:<8} "
+                 f"{'online' if hub['online'] else 'not seen':<9} {configured.get(hub['id'], '- not configured -')}"
+                 for hub in hubs]
+        self.logger.info(f"{len(hubs)} discovered Camect hubs:\n" + "\n".join(lines))
+        return True
+
+    def dumpMetrics(self):
+        for devID in self.camects:
+            device = indigo.devices[devID]
+            metrics = self.metrics.setdefault(devID, HubMetrics())
+            cache = self.image_cache.stats(devID)
+            actions = self.action_queues[devID].stats()
+            self.logger.info(f"{device.name}: Event pipeline metrics:\n{metrics.summary()}\n"
+                             f"Snapshot cache: {cache['hits']} hits, {cache['misses']} misses ({cache['hit_rate']}%), "
+                             f"{cache['prefetches']} prefetched, {cache['failed']} failed, prefetch p50 "
+                             f"{cache['prefetch_p50_ms']:.1f} ms, p95 {cache['prefetch_p95_ms']:.1f} ms, "
+                             f"{cache['entries']} images, {cache['bytes'] / 1048576:.1f} MB\n"
+                             f"Actions: {actions['completed']} completed, {actions['failed']} failed, "
+                             f"{actions['coalesced']} coalesced, {actions['duplicates']} duplicates, "
+                             f"{actions['rejected']} rejected, queued {actions['depth']} (max {actions['max_depth']}), "
+                             f"p50 {actions['latency_p50_ms']:.1f} ms, p95 {actions['latency_p95_ms']:.1f} ms")
+        if self.event_store:
+            store = self.event_store.stats()
+            self.logger.info(f"Event store: {store['written']} written in {store['batches']} batches, "
+                             f"{store['pending']} pending, {store['dropped']} dropped, {store['pruned']} pruned, "
+                             f"last batch {store['last_batch_ms']:.1f} ms")
+        if self.snapshot_processor:
+            snaps = self.snapshot_processor.stats()
+            self.logger.info(f"Snapshot sizes: {snaps['completed']} completed, {snaps['failed']} failed ({snaps['mode']}), "
+                             f"decode p50 {snaps['decode_p50_ms']:.1f} ms, p95 {snaps['decode_p95_ms']:.1f} ms, "
+                             f"resize p50 {snaps['resize_p50_ms']:.1f} ms, p95 {snaps['resize_p95_ms']:.1f} ms, "
+                             f"encode p50 {snaps['encode_p50_ms']:.1f} ms, p95 {snaps['encode_p95_ms']:.1f} ms, "
+                             f"total p50 {snaps['total_p50_ms']:.1f} ms, p95 {snaps['total_p95_ms']:.1f} ms")
+        return True
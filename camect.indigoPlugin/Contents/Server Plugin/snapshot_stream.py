@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import base64
+import binascii
+import re
+
+_SEARCH = 0     # looking for the field name
+_OPEN = 1       # looking for the opening quote of the value
+_VALUE = 2      # decoding the value
+_DONE = 3
+
+_ESCAPE = re.compile(rb'\\(u[0-9a-fA-F]{4}|.)', re.DOTALL)
+_SIMPLE_ESCAPES = {b'"': b'"', b'\\': b'\\', b'/': b'/', b'b': b'\b', b'f': b'\f', b'n': b'\n', b'r': b'\r', b't': b'\t'}
+_BASE64_CHARS = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/= \t\r\n")
+
+
+def _escape_value(match):
+    escape = match.group(1)
+    if len(escape) == 5:
+        code = int(escape[1:], 16)
+        value = bytes([code]) if code < 128 else None
+    else:
+        value = _SIMPLE_ESCAPES.get(escape)
+    if value is None or value[0] not in _BASE64_CHARS:
+        raise ValueError(f"invalid image data: escape \\{escape.decode(errors='replace')}")
+    return value.strip()      # line breaks in wrapped base64 carry no data
+
+
+########################################
+class JsonBase64Decoder:
+    ########################################
+    """ Incrementally extract and base64-decode one string field from a JSON document.
+
+    Used for the SnapshotCamera response ({"jpeg_data": "<base64>"}), so the image is decoded
+    chunk by chunk straight into a file instead of holding the body, the parsed JSON and the
+    decoded image in memory at the same time.
+    """
+
+    def __init__(self, out, field="jpeg_data"):
+        self.out = out
+        self.bytes_written = 0
+        self._marker = f'"{field}"'.encode()
+        self._state = _SEARCH
+        self._buf = b""
+        self._pending = b""         # base64 characters left over from the last chunk
+
+    def feed(self, chunk):
+        if self._state == _DONE or not chunk:
+            return
+        data = self._buf + chunk
+        self._buf = b""
+
+        if self._state == _SEARCH:
+            index = data.find(self._marker)
+            if index < 0:
+                # keep enough to match a marker split across chunks
+                self._buf = data[-(len(self._marker) - 1):]
+                return
+            data = data[index + len(self._marker):]
+            self._state = _OPEN
+
+        if self._state == _OPEN:
+            index = data.find(b'"')
+            if index < 0:
+                return
+            data = data[index + 1:]
+            self._state = _VALUE
+
+        end = data.find(b'"')
+        if end >= 0:
+            if data[end - 1:end] == b"\\":
+                # an escaped quote, or an escaped backslash before the closing quote, neither is base64
+                raise ValueError("invalid image data: escaped quote or backslash")
+            data = data[:end]
+        else:
+            # keep an escape cut off by the end of the chunk for the next one
+            index = data.rfind(b"\\", -6)
+            if index >= 0 and (index == len(data) - 1 or data[index + 1:index + 2] == b"u" and len(data) - index < 6):
+                data, self._buf = data[:index], data[index:]
+        self._decode(self._unescape(data))
+        if end >= 0:
+            self._decode(b"", final=True)
+            self._state = _DONE
+
+    def close(self):
+        if self._state != _DONE:
+            raise ValueError("incomplete or missing image data")
+
+    @staticmethod
+    def _unescape(data):
+        # JSON string escapes.  Base64 '/' is often escaped as '\/', anything else is rare
+        if b"\\" not in data:
+            return data
+        data = data.replace(b"\\/", b"/")
+        if b"\\" not in data:
+            return data
+        data = _ESCAPE.sub(_escape_value, data)
+        if b"\\" in data:
+            raise ValueError("invalid image data: incomplete escape")
+        return data
+
+    def _decode(self, data, final=False):
+        data = self._pending + data
+        usable = len(data) if final else len(data) - len(data) % 4
+        self._pending = data[usable:]
+        if usable:
+            try:
+                image = base64.b64decode(data[:usable])
+            except binascii.Error as err:
+                raise ValueError(f"invalid image data: {err}")
+            self.out.write(image)
+            self.bytes_written += len(image)
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import logging
+import threading
+
+_MISSING = object()
+
+
+########################################
+class StateWriter:
+    ########################################
+    """ Sends only changed device states to the server, optionally coalescing bursts.
+
+    With a window of 0 each update is written at once, minus the keys that haven't changed.  With a
+    window > 0 the first update starts a timer and everything that arrives before it fires is merged
+    into a single write holding the latest values.  flush() writes what's pending at once, for callers
+    that need the states current (before running triggers).
+    """
+
+    def __init__(self, name, write, window=0.0):
+        self.logger = logging.getLogger("Plugin.StateWriter")
+        self.name = name
+        self.write = write              # called with a key_value_list
+        self.window = window
+        self.updates = 0
+        self.writes = 0
+        self._sent = {}
+        self._pending = {}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def update(self, key_value_list):
+        with self._lock:
+            self.updates += 1
+            for item in key_value_list:
+                key, value = item['key'], item['value']
+                if self._sent.get(key, _MISSING) != value:
+                    self._pending[key] = value
+                else:
+                    self._pending.pop(key, None)
+            if not self._pending or self._timer:
+                return
+            if self.window > 0:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        try:
+            self.write([{'key': key, 'value': value} for key, value in pending.items()])
+        except Exception as err:
+            self.logger.warning(f"{self.name}: state update failed: {err}")
+            return
+        with self._lock:
+            self._sent.update(pending)
+            self.writes += 1
+
+    def stats(self):
+        with self._lock:
+            return {'updates': self.updates, 'writes': self.writes, 'saved': self.updates - self.writes}
@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+####################
+
+import itertools
+import threading
+import time
+
+ANY = "-1"      # wildcard value used by the config menus ("- Any Camect -", etc.)
+
+
+########################################
+class TriggerIndex:
+    ########################################
+    """ Dispatch index for plugin triggers.
+
+    Each trigger is stored under every combination of the values it accepts for each key
+    (hub, camera, object, ...), with "-1" used as the wildcard bucket.  A lookup only visits the
+    buckets that can match the event, so the cost scales with the matching triggers and not with
+    the total number of triggers.
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+        self._buckets = {}
+        self._keys = {}
+        self._triggers = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, trigger_id):
+        return trigger_id in self._keys
+
+    def add(self, trigger_id, trigger, *values):
+        """ values is one entry per key, each either a single value or a list of values.
+        """
+        assert len(values) == self.depth
+        self.remove(trigger_id)
+        keys = list(itertools.product(*[_as_list(v) for v in values]))
+        for key in keys:
+            self._buckets.setdefault(key, {})[trigger_id] = trigger
+        self._keys[trigger_id] = keys
+        self._triggers[trigger_id] = trigger
+
+    def triggers(self):
+        return list(self._triggers.values())
+
+    def remove(self, trigger_id):
+        self._triggers.pop(trigger_id, None)
+        for key in self._keys.pop(trigger_id, []):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            bucket.pop(trigger_id, None)
+            if not bucket:
+                del self._buckets[key]
+
+    def lookup(self, *values):
+        """ Return {trigger_id: trigger} for all triggers matching the event values.  Each entry in
+        values is a single value or a list of candidate values (i.e. the detected objects).
+        """
+        assert len(values) == self.depth
+        found = {}
+        candidates = [set(_as_list(v)) | {ANY} for v in values]
+        for key in itertools.product(*candidates):
+            bucket = self._buckets.get(key)
+            if bucket:
+                found.update(bucket)
+        return found
+
+
+########################################
+class AlertPredicate:
+    ########################################
+    """ The object, time of day and cooldown conditions of an alertEvent trigger, compiled once from its props.
+
+    Objects are matched as sets against the detected objects: any (or with match_all, every) selected
+    object must be present, and none of the excluded ones.  The time window is in minutes since midnight
+    and may wrap past midnight.  The hub and camera are left to the TriggerIndex.
+    """
+
+    __slots__ = ("objects", "match_all", "excluded", "window", "cooldown", "last_fired", "_lock")
+
+    def __init__(self, objects=(), match_all=False, excluded=(), window=None, cooldown=0.0):
+        self.objects = frozenset(objects) - {ANY}
+        self.match_all = match_all and bool(self.objects)
+        self.excluded = frozenset(excluded) - {ANY}
+        self.window = window
+        self.cooldown = cooldown
+        self.last_fired = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_props(cls, props):
+        """ Raises ValueError for a bad time or cooldown.
+        """
+        start, end = parse_time(props.get("startTime", "")), parse_time(props.get("endTime", ""))
+        window = (start, end) if start is not None and end is not None and start != end else None
+        return cls(objects=_as_list(props.get("object", [])),
+                   match_all=props.get("matchAll", False),
+                   excluded=_as_list(props.get("excludeObject", [])),
+                   window=window,
+                   cooldown=float(props.get("cooldown", 0) or 0))
+
+    def matches(self, objects, minute):
+        """ objects is the frozenset of detected objects, minute is the event's minutes since midnight.
+        """
+        if self.match_all:
+            if not self.objects <= objects:
+                return False
+        elif self.objects and self.objects.isdisjoint(objects):
+            return False
+        if self.excluded and not self.excluded.isdisjoint(objects):
+            return False
+        if self.window:
+            start, end = self.window
+            if start < end:
+                if not start <= minute < end:
+                    return False
+            elif end <= minute < start:
+                return False
+        return True
+
+    def fire(self, now=None):
+        """ Start the cooldown, returns False if the trigger is still cooling down from the last time it fired.
+        """
+        if not self.cooldown:
+            return True
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.last_fired is not None and now - self.last_fired < self.cooldown:
+                return False
+            self.last_fired = now
+            return True
+
+
+def parse_time(text):
+    """ "HH:MM" to minutes since midnight, None for an empty string.
+    """
+    text = (text or "").strip()
+    if not text:
+        return None
+    hours, _, minutes = text.partition(":")
+    hours, minutes = int(hours), int(minutes or 0)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"invalid time '{text}'")
+    return hours * 60 + minutes
+
+
+def _as_list(value):
+    if isinstance(value, str):
+        return [value]
+    return [str(v) for v in value]